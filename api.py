@@ -0,0 +1,351 @@
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from urllib.parse import urlsplit, parse_qs, urlencode
+
+from database import db
+from categories import CategoryCache
+from tasks import TaskRepository
+from recurrences import RecurrenceRepository, parse_occurrence_id
+from services import TaskService, ServiceError
+from session import SessionStore
+from migrations import migrate
+from validation import PRIORITIES
+import dates
+
+# A local HTTP/JSON API over the same services the screens use, built on asyncio from the standard library.
+# python api.py serve starts it, and python api.py load drives many concurrent clients against it to measure
+# throughput. Every request apart from /signup and /login needs an "Authorization: Bearer <token>" header.
+#
+#   POST /signup {"username", "password"}          POST /login {"username", "password"} -> {"token"}
+#   POST /logout                                   GET /categories, POST /categories {"name"}
+#   GET /tasks?filter=all&category=&limit=&cursor=  POST /tasks {"title", "due_date", "description",
+#   GET /tasks/search?q=                                          "category", "priority"}
+#   GET|PUT|DELETE /tasks/<id>                     POST /tasks/<id>/complete
+#   GET /stats
+#
+# Repeating tasks are listed as their occurrences, with an id like r12:2025-01-31 (see recurrences.py) that the
+# /tasks/<id> routes also accept.
+
+HOST = "127.0.0.1"
+PORT = 8765
+THREADS = 8  # database work runs on this many threads, so the event loop itself never waits on SQLite
+MAX_BODY = 64 * 1024
+MAX_LIMIT = 200
+STATUS_TEXT = {200: "OK", 201: "Created", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+               405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def task_json(row):
+    task_id, title, due_date, priority, status, category_id = row[:6]
+    task = {"task_id": task_id, "title": title, "due_date": dates.to_display(due_date), "priority": priority,
+            "status": status, "category_id": category_id}
+    if len(row) > 6:
+        task["description"] = row[6] or ""
+    return task
+    # due dates are sent as DD-MM-YYYY, the same way they are typed in
+
+
+async def read_request(reader):
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise HTTPError(400, "Malformed Content-Length")
+    if length < 0:
+        raise HTTPError(400, "Malformed Content-Length")
+    if length > MAX_BODY:
+        raise HTTPError(413, "Request body is too large")
+    body = await reader.readexactly(length) if length else b""
+    return method, target, headers, body
+
+
+def write_response(writer, status, payload, keep_alive):
+    body = json.dumps(payload).encode()
+    writer.write(f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                 f"Content-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n"
+                 f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body)
+
+
+class TaskAPI:
+    def __init__(self, database=db, threads=THREADS):
+        self.database = database
+        self.sessions = SessionStore(database)
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix="api")
+        self.requests = 0
+
+    def service(self):
+        return TaskService(self.database, CategoryCache(self.database), TaskRepository(self.database),
+                           RecurrenceRepository(self.database))
+        # a new service for every request, so categories and repeating tasks are read from SQLite as they are now.
+        # A cache kept on one thread would not see a category that another thread has just created. The caches are
+        # only filled if the request needs them, and each fill is one indexed query
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HTTPError as error:
+                    write_response(writer, error.status, {"error": str(error)}, False)
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                self.requests += 1
+                status, payload = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, self.respond, method, target, headers, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+            # connections are kept open between requests unless the client asks for them to be closed
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def respond(self, method, target, headers, body):  # runs on one of the executor's threads
+        try:
+            url = urlsplit(target)
+            query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            try:
+                data = json.loads(body) if body else {}
+            except ValueError:
+                raise HTTPError(400, "Body must be JSON")
+            return self.route(method, url.path.rstrip("/"), query, data, headers.get("authorization", ""))
+        except HTTPError as error:
+            return error.status, {"error": str(error)}
+        except ServiceError as error:
+            return 400, {"error": str(error)}
+        except Exception as error:
+            return 500, {"error": f"{type(error).__name__}: {error}"}
+
+    def route(self, method, path, query, data, authorization):
+        service = self.service()
+        if path == "/signup" and method == "POST":
+            return 201, {"user_id": service.sign_up(str(data.get("username", "")), str(data.get("password", "")))}
+        if path == "/login" and method == "POST":
+            user_id = service.log_in(str(data.get("username", "")), str(data.get("password", "")))
+            if user_id is None:
+                raise HTTPError(401, "Invalid username or password")
+            return 200, {"token": self.sessions.create(user_id)}
+
+        token = authorization[7:] if authorization.startswith("Bearer ") else ""
+        user_id = self.sessions.user_for(token)
+        if user_id is None:
+            raise HTTPError(401, "Log in first")
+        parts = path.strip("/").split("/")
+
+        if path == "/logout" and method == "POST":
+            self.sessions.delete(token)
+            return 200, {}
+        if parts == ["categories"]:
+            if method == "GET":
+                return 200, {"categories": service.category_names(user_id)}
+            if method == "POST":
+                return 201, {"category_id": service.create_category(user_id, str(data.get("name", "")))}
+        if parts == ["stats"] and method == "GET":
+            return 200, service.task_stats(user_id)
+        if parts == ["tasks"]:
+            if method == "GET":
+                return 200, self.list_tasks(service, user_id, query)
+            if method == "POST":
+                task_id, category_id = service.create_task(user_id, *self.task_fields(data))
+                return 201, {"task_id": task_id, "category_id": category_id}
+        if parts == ["tasks", "search"] and method == "GET":
+            limit = self.limit(query, MAX_LIMIT)
+            return 200, {"tasks": [task_json(row) for row in service.search_tasks(user_id, query.get("q", ""), limit)]}
+        if len(parts) in (2, 3) and parts[0] == "tasks" and self.task_id(parts[1]) is not None:
+            task_id = self.task_id(parts[1])
+            try:
+                task = service.get_task(user_id, task_id)
+            except ServiceError as error:
+                raise HTTPError(404, str(error))
+            # every task route checks that the task belongs to the user first
+            if len(parts) == 3 and parts[2] == "complete" and method == "POST":
+                service.complete_task(user_id, task_id)
+                return 200, {}
+            if len(parts) == 2:
+                if method == "GET":
+                    return 200, task_json(task)
+                if method == "PUT":
+                    return 200, {"category_id": service.update_task(user_id, task_id, *self.task_fields(data))}
+                if method == "DELETE":
+                    service.delete_task(user_id, task_id)
+                    return 200, {}
+        raise HTTPError(404, f"No route for {method} {path}")
+
+    def task_id(self, part):
+        if part.isdigit():
+            return int(part)
+        try:
+            occurrence = parse_occurrence_id(part)
+            if occurrence is None:
+                return None
+            date.fromisoformat(occurrence[1])
+        except ValueError:
+            return None
+        return part
+        # a task_id, or the id of an occurrence of a repeating task with a real YYYY-MM-DD date, otherwise None
+
+    def task_fields(self, data):
+        priority = PRIORITIES.get(str(data.get("priority", "")).strip().lower())
+        return (str(data.get("title", "")), str(data.get("due_date", "")), str(data.get("description", "")),
+                str(data.get("category", "")), priority)
+        # title, due_date (DD-MM-YYYY), description, category name and priority, checked by the service
+
+    def limit(self, query, default):
+        try:
+            limit = int(query.get("limit", default))
+        except ValueError:
+            raise HTTPError(400, "limit must be a whole number")
+        return max(1, min(limit, MAX_LIMIT))
+        # kept between 1 and MAX_LIMIT, a negative LIMIT would mean no limit at all to SQLite
+
+    def cursor(self, query):
+        if not query.get("cursor"):
+            return None
+        try:
+            after = json.loads(query["cursor"])
+        except ValueError:
+            raise HTTPError(400, "Malformed cursor")
+        if not isinstance(after, list) or not all(isinstance(value, (str, int, float)) for value in after):
+            raise HTTPError(400, "Malformed cursor")
+        return after
+
+    def list_tasks(self, service, user_id, query):
+        limit = self.limit(query, 50)
+        after = self.cursor(query)
+        rows, cursor = service.list_tasks(user_id, query.get("filter", "all"), query.get("category"), limit, after)
+        return {"tasks": [task_json(row) for row in rows], "cursor": json.dumps(cursor) if cursor else None}
+        # cursor is passed back to fetch the next page, which carries on after the last task with keyset pagination.
+        # Repeating tasks are merged in as their occurrences, the same as on the TaskListScreen
+
+    async def serve(self, host=HOST, port=PORT):
+        server = await asyncio.start_server(self.handle_connection, host, port, backlog=4096)
+        print(f"Serving on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def prepare_database(database=db):
+    migrate(database)
+    # every connection is opened in WAL mode (see database.PRAGMAS), so the API's threads keep reading while
+    # another thread writes
+
+
+async def request(reader, writer, method, path, payload=None, token=None):
+    body = json.dumps(payload).encode() if payload is not None else b""
+    headers = f"{method} {path} HTTP/1.1\r\nHost: {HOST}\r\nContent-Length: {len(body)}\r\n"
+    if token:
+        headers += f"Authorization: Bearer {token}\r\n"
+    writer.write(headers.encode() + b"\r\n" + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def load_test(host, port, clients, requests_per_client, username, password):
+    reader, writer = await asyncio.open_connection(host, port)
+    await request(reader, writer, "POST", "/signup", {"username": username, "password": password})
+    status, result = await request(reader, writer, "POST", "/login", {"username": username, "password": password})
+    if status != 200:
+        raise SystemExit(f"Could not log in as {username}: {result}")
+    token = result["token"]
+    await request(reader, writer, "POST", "/tasks", {"title": "Load test", "due_date": dates.to_display(dates.today()),
+                                                     "category": "None", "priority": 2}, token)
+    writer.close()
+    # one user and task are set up first, then every client reads the task list with the same token
+
+    latencies = []
+    errors = 0
+
+    async def client(number):
+        nonlocal errors
+        client_reader, client_writer = await asyncio.open_connection(host, port)
+        path = "/tasks?" + urlencode({"filter": "all", "limit": 50})
+        for count in range(requests_per_client):
+            if count % 10 == number % 10:
+                path_used, method, payload = "/tasks", "POST", {
+                    "title": f"Client {number}", "due_date": dates.to_display(dates.today()), "category": "None",
+                    "priority": 1}
+            else:
+                path_used, method, payload = path, "GET", None
+            # one request in ten is a write, the rest read the first page of tasks
+            start = time.perf_counter()
+            status, _ = await request(client_reader, client_writer, method, path_used, payload, token)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if status >= 400:
+                errors += 1
+        client_writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(number) for number in range(clients)))
+    seconds = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "clients": clients,
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(seconds, 2),
+        "requests_per_second": round(len(latencies) / seconds),
+        "p50_ms": round(latencies[len(latencies) // 2], 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95)], 2),
+        "max_ms": round(latencies[-1], 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TaskSphere's local HTTP/JSON API")
+    parser.add_argument("command", choices=("serve", "load"))
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--threads", type=int, default=THREADS, help="database threads for serve")
+    parser.add_argument("--clients", type=int, default=200, help="concurrent connections for load")
+    parser.add_argument("--requests", type=int, default=50, help="requests each client makes for load")
+    parser.add_argument("--username", default="loadtest")
+    parser.add_argument("--password", default="LoadTest1!")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        prepare_database()
+        try:
+            asyncio.run(TaskAPI(threads=args.threads).serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+    else:
+        print(json.dumps(asyncio.run(load_test(args.host, args.port, args.clients, args.requests, args.username,
+                                                   args.password))))
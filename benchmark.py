@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+from database import Database, PRAGMAS, BASELINE_PRAGMAS
+from migrations import migrate
+from tasks import TaskRepository, task_values
+from passwords import hash_password, verify_password
+import queries
+import dates
+
+# Times the queries and writes behind the app's hot paths on generated databases, without needing Kivy or a
+# window. python benchmark.py --sizes 1000,100000,1000000 --out benchmark_report.json writes a JSON report that
+# can be diffed between commits.
+
+PASSWORD = "Benchmark1!"
+BATCH_SIZE = 10000  # generated tasks are inserted this many at a time
+
+
+def user_weights(users, skew):
+    weights = [1 / (rank + 1) ** skew for rank in range(users)]
+    total = sum(weights)
+    return [weight / total for weight in weights]
+    # a Zipf-like share of the tasks for each user, skew 0 gives everyone the same number of tasks and larger
+    # values give the first user more and more of them
+
+
+def generate(path, tasks, users=10, categories=8, skew=1.0, seed=1):
+    rng = random.Random(seed)
+    database = Database(path)
+    migrate(database)
+    password_hash = hash_password(PASSWORD)  # hashed once and shared, so generating stays quick
+    database.executemany("INSERT INTO Users (username, password_hash) VALUES (?, ?)",
+                         [(f"user{number}", password_hash) for number in range(users)])
+    user_ids = [row[0] for row in database.fetchall("SELECT user_id FROM Users ORDER BY user_id")]
+    database.executemany("INSERT INTO Categories (category_name, user_id) VALUES (?, ?)",
+                         [(name, user_id) for user_id in user_ids
+                          for name in ["None"] + [f"Category {number}" for number in range(1, categories)]])
+    database.commit()
+    category_ids = {}
+    for category_id, user_id in database.fetchall("SELECT category_id, user_id FROM Categories"):
+        category_ids.setdefault(user_id, []).append(category_id)
+
+    today = date.today()
+    weights = user_weights(len(user_ids), skew)
+    remaining = tasks
+    while remaining:
+        batch = []
+        for user_id in rng.choices(user_ids, weights, k=min(BATCH_SIZE, remaining)):
+            due_date = (today + timedelta(days=rng.randint(-30, 60))).isoformat()
+            status = "completed" if rng.random() < 0.2 else "pending"
+            batch.append(task_values(user_id, rng.choice(category_ids[user_id]), f"Task {rng.randint(1, 10 ** 6)}",
+                                     "Generated task for benchmarking", due_date, rng.randint(1, 3), status))
+        database.executemany(queries.INSERT_TASK_WITH_STATUS, batch)
+        database.commit()
+        remaining -= len(batch)
+    # due dates are spread from a month ago to two months ahead so the overdue, today and week filters all match
+    database.execute("ANALYZE")
+    database.commit()
+    return database
+
+
+def time_case(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return {
+        "runs": repeat,
+        "min_ms": round(times[0], 3),
+        "median_ms": round(statistics.median(times), 3),
+        "p95_ms": round(times[min(len(times) - 1, int(len(times) * 0.95))], 3),
+        "max_ms": round(times[-1], 3),
+    }
+
+
+def cases(database, user_id, username, page_size=50):
+    today, tomorrow, week_end = dates.today(), dates.future_date(1), dates.future_date(7)
+    category_id = database.fetchvalue("SELECT category_id FROM Categories WHERE user_id = ? AND category_name = ?",
+                                      (user_id, "Category 1"))
+    task_lists = {
+        "all": (queries.ALL_TASKS, (user_id,)),
+        "today": (queries.TODAY_TASKS, (today, user_id)),
+        "overdue": (queries.OVERDUE_TASKS, (user_id, today)),
+        "next 7 days": (queries.WEEK_TASKS, (user_id, today, week_end)),
+        "completed": (queries.COMPLETED_TASKS, ("completed", user_id)),
+        "category": (queries.CATEGORY_TASKS, (category_id, user_id)),
+    }
+    reads = {}
+    for name, (query, params) in task_lists.items():
+        first_page = database.fetchall(query.first_page, params + (page_size,))
+        reads[f"task list {name}"] = lambda q=query, p=params: database.fetchall(q.first_page, p + (page_size,))
+        if first_page:
+            after = params + query.after(first_page[-1]) + (page_size,)
+            reads[f"task list {name} next page"] = lambda q=query, a=after: database.fetchall(q.next_page, a)
+    # TaskListScreen.on_enter and scrolling
+
+    reads["due task reminders"] = lambda: database.fetchall(queries.DUE_TASKS, (user_id, dates.future_date(3)))
+    reads["category buttons"] = lambda: database.fetchall(queries.USER_CATEGORIES, (user_id,))
+    reads["search"] = lambda: database.fetchall(queries.SEARCH_TASKS, (queries.search_match("task 1"), user_id, 200))
+
+    def login():
+        _, stored_hash = database.fetchone(queries.LOGIN, (username,))
+        return verify_password(PASSWORD, stored_hash, cache=False)
+        # the verification cache is skipped so the full cost of the password hash is measured
+    reads["login"] = login
+
+    repository = TaskRepository(database)
+
+    def load_repository():
+        repository.clear()
+        repository.load(user_id)
+    reads["task repository load"] = load_repository
+    reads["task repository select all"] = lambda: repository.select("all")
+    reads["task repository select week"] = lambda: repository.select("week", today=today, week_end=week_end)
+
+    counter = iter(range(10 ** 9))
+    first_task = database.fetchvalue("SELECT MIN(task_id) FROM Tasks WHERE user_id = ?", (user_id,))
+    writes = {
+        "insert task": lambda: database.write(queries.INSERT_TASK, (user_id, category_id, f"New {next(counter)}", "",
+                                                                    tomorrow, 2)),
+        "update task": lambda: database.write("UPDATE Tasks SET priority = ? WHERE task_id = ? AND user_id = ?",
+                                              (next(counter) % 3 + 1, first_task, user_id)),
+        "insert 1000 tasks": lambda: repository.insert_many(user_id, [
+            (category_id, f"Bulk {next(counter)}", "", tomorrow, 1) for _ in range(1000)]),
+    }
+    # each write is committed on its own, the same way the screens save tasks
+    return reads, writes
+
+
+def run(sizes, users, categories, skew, repeat, directory):
+    results = {}
+    for size in sizes:
+        path = os.path.join(directory, f"benchmark_{size}.db")
+        if os.path.exists(path):
+            os.remove(path)
+        start = time.perf_counter()
+        database = generate(path, size, users, categories, skew)
+        generate_seconds = time.perf_counter() - start
+        user_id, username, task_count = database.fetchone(
+            "SELECT Users.user_id, username, COUNT(*) FROM Users JOIN Tasks ON Tasks.user_id = Users.user_id "
+            "GROUP BY Users.user_id ORDER BY COUNT(*) DESC LIMIT 1")
+        # every case is timed for the user with the most tasks, which is the slowest case for the app
+        database.close()
+        result = results[str(size)] = {"generate_seconds": round(generate_seconds, 2), "user_tasks": task_count,
+                                       "writes": {}}
+        for config, pragmas in (("baseline", BASELINE_PRAGMAS), ("tuned", PRAGMAS)):
+            database = Database(path, pragmas=pragmas)
+            reads, writes = cases(database, user_id, username)
+            if pragmas is PRAGMAS:
+                result["reads"] = {name: time_case(function, repeat) for name, function in reads.items()}
+            result["writes"][config] = {name: time_case(function, repeat) for name, function in writes.items()}
+            database.close()
+        # writes are timed with SQLite's default rollback journal and full sync, and then with the app's WAL
+        # settings, so the report shows the change in write latency and its p95/max tail
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        print(f"{size} tasks done in {time.perf_counter() - start:.1f} s")
+    return {
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "users": users,
+        "categories": categories,
+        "skew": skew,
+        "repeat": repeat,
+        "sizes": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time TaskSphere's queries and writes on generated databases")
+    parser.add_argument("--sizes", default="1000,100000,1000000", help="comma separated numbers of tasks")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--categories", type=int, default=8, help="categories per user, including None")
+    parser.add_argument("--skew", type=float, default=1.0, help="how unevenly tasks are shared between users")
+    parser.add_argument("--repeat", type=int, default=20, help="how many times each read is timed")
+    parser.add_argument("--out", default="benchmark_report.json")
+    parser.add_argument("--dir", default=tempfile.gettempdir(), help="where the generated databases are made")
+    args = parser.parse_args()
+
+    report = run([int(size) for size in args.sizes.split(",")], args.users, args.categories, args.skew,
+                 args.repeat, args.dir)
+    with open(args.out, "w") as file:
+        json.dump(report, file, indent=2, sort_keys=True)
+    print(f"Report written to {args.out}")
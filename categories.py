@@ -0,0 +1,64 @@
+import threading
+
+from database import db
+import queries
+
+
+class CategoryCache:  # one user's categories, loaded in a single query and then kept up to date by every write
+    def __init__(self, database=db):
+        self.database = database
+        self.lock = threading.Lock()  # the cache is read on the main thread and written on the database worker
+        self.user_id = None  # the user whose categories are loaded, None if nothing is loaded
+        self.ids_by_name = {}
+        self.names_by_id = {}
+        self.version = 0  # goes up by one every time the cached categories change
+
+    def is_loaded(self, user_id):
+        return user_id is not None and self.user_id == user_id
+
+    def load(self, user_id):
+        if self.is_loaded(user_id):
+            return
+        rows = self.database.fetchall(queries.USER_CATEGORIES, (user_id,))
+        with self.lock:
+            self.user_id = user_id
+            self.ids_by_name = {name: category_id for category_id, name in rows}
+            self.names_by_id = {category_id: name for category_id, name in rows}
+            self.version += 1
+        # fills both dictionaries from one query, unless they already hold this user's categories
+
+    def clear(self):
+        with self.lock:
+            self.user_id = None
+            self.ids_by_name = {}
+            self.names_by_id = {}
+            self.version += 1
+
+    def names(self, user_id):
+        self.load(user_id)
+        with self.lock:
+            return list(self.ids_by_name)
+
+    def get_id(self, user_id, category_name):
+        self.load(user_id)
+        with self.lock:
+            return self.ids_by_name.get(category_name)
+
+    def get_name(self, user_id, category_id):
+        self.load(user_id)
+        with self.lock:
+            return self.names_by_id.get(category_id)
+
+    def add(self, user_id, category_name):
+        self.load(user_id)
+        cur = self.database.write("INSERT INTO Categories (category_name, user_id) VALUES (?, ?)",
+                                  (category_name, user_id))
+        # raises sqlite3.IntegrityError if the user already has a category with this name
+        with self.lock:
+            self.ids_by_name[category_name] = cur.lastrowid
+            self.names_by_id[cur.lastrowid] = category_name
+            self.version += 1
+        return cur.lastrowid
+
+
+category_cache = CategoryCache()  # the cache that every screen looks categories up in
@@ -0,0 +1,202 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from profiler import profiler
+
+DB_PATH = "task_manager.db"
+
+PRAGMAS = {
+    "journal_mode": "WAL",  # readers and the one writer no longer block each other, and a commit appends to the log
+    "synchronous": "NORMAL",  # in WAL mode this only syncs at checkpoints, a power cut can lose the last commits but
+    # never corrupts the file
+    "mmap_size": 64 * 1024 * 1024,  # reads come straight from memory mapped pages instead of read() calls
+    "cache_size": -8000,  # about 8 MB of page cache per connection (negative values are in KiB)
+    "busy_timeout": 5000,  # waits up to 5 seconds for another writer instead of failing with "database is locked"
+    "temp_store": "MEMORY",
+}
+# applied to every connection when it is opened
+
+BASELINE_PRAGMAS = {"journal_mode": "DELETE", "synchronous": "FULL"}
+# SQLite's own defaults, used by benchmark.py to compare write latency with and without PRAGMAS
+
+
+class QueryStats:  # keeps a count and timing for every distinct query that goes through the Database class
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queries = {}
+        # maps each SQL string to [count, total_seconds, slowest_seconds]
+
+    def record(self, sql, elapsed):
+        if profiler.enabled:
+            profiler.record(sql, elapsed * 1000)
+        with self.lock:
+            entry = self.queries.get(sql)
+            if entry is None:
+                self.queries[sql] = [1, elapsed, elapsed]
+            else:
+                entry[0] += 1
+                entry[1] += elapsed
+                if elapsed > entry[2]:
+                    entry[2] = elapsed
+
+    def report(self):
+        with self.lock:
+            rows = [
+                {
+                    "sql": " ".join(sql.split()),  # collapses whitespace so multi-line queries print on one line
+                    "count": count,
+                    "total_ms": total * 1000,
+                    "avg_ms": total * 1000 / count,
+                    "max_ms": slowest * 1000,
+                }
+                for sql, (count, total, slowest) in self.queries.items()
+            ]
+        rows.sort(key=lambda row: row["total_ms"], reverse=True)
+        # the queries that have taken the most time overall are listed first
+        return rows
+
+    def reset(self):
+        with self.lock:
+            self.queries.clear()
+
+
+class Database:  # one shared, long-lived way into the SQLite file for the whole app
+    def __init__(self, path=DB_PATH, pool_size=4, statement_cache_size=128, pragmas=PRAGMAS):
+        self.path = path
+        self.pragmas = pragmas
+        self.pool_size = pool_size  # the most idle connections that are kept open for reuse
+        self.statement_cache_size = statement_cache_size  # prepared statements kept per connection
+        self.stats = QueryStats()
+        self.local = threading.local()  # each thread holds on to its own connection
+        self.lock = threading.Lock()
+        self.idle = []  # connections that have been released by a thread and can be handed out again
+        self.connections = []  # every connection that has been opened, so they can all be closed
+
+    def open_connection(self):
+        conn = sqlite3.connect(
+            self.path,
+            check_same_thread=False,  # connections can move between threads through the pool
+            cached_statements=self.statement_cache_size,
+            # sqlite3 keeps the prepared statement for each SQL string, so repeated queries skip parsing
+        )
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        with self.lock:
+            self.connections.append(conn)
+        return conn
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            with self.lock:
+                conn = self.idle.pop() if self.idle else None
+            if conn is None:
+                conn = self.open_connection()
+            self.local.conn = conn
+        return conn
+        # returns the calling thread's connection, taking one from the pool the first time a thread asks
+
+    def release(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            return
+        self.local.conn = None
+        with self.lock:
+            if len(self.idle) < self.pool_size:
+                self.idle.append(conn)
+                return
+            self.connections.remove(conn)
+        conn.close()
+        # gives the calling thread's connection back to the pool, closing it if the pool is already full
+
+    def close(self):
+        with self.lock:
+            connections = self.connections
+            self.connections = []
+            self.idle = []
+        for conn in connections:
+            conn.close()
+        self.local = threading.local()
+
+    def execute(self, sql, params=()):
+        start = time.perf_counter()
+        cur = self.connection().execute(sql, params)
+        self.stats.record(sql, time.perf_counter() - start)
+        return cur
+
+    def executemany(self, sql, seq_of_params):
+        start = time.perf_counter()
+        cur = self.connection().executemany(sql, seq_of_params)
+        self.stats.record(sql, time.perf_counter() - start)
+        return cur
+
+    def executescript(self, script):
+        start = time.perf_counter()
+        self.connection().executescript(script)
+        self.stats.record(script, time.perf_counter() - start)
+
+    def fetchone(self, sql, params=()):
+        start = time.perf_counter()
+        row = self.connection().execute(sql, params).fetchone()
+        self.stats.record(sql, time.perf_counter() - start)
+        return row
+
+    def fetchall(self, sql, params=()):
+        start = time.perf_counter()
+        rows = self.connection().execute(sql, params).fetchall()
+        self.stats.record(sql, time.perf_counter() - start)
+        return rows
+
+    def fetchvalue(self, sql, params=()):
+        row = self.fetchone(sql, params)
+        if row is None:
+            return None
+        return row[0]
+        # returns the first column of the first row, or None if nothing matched
+
+    def write(self, sql, params=()):
+        with self.transaction():
+            return self.execute(sql, params)
+        # runs a single INSERT/UPDATE/DELETE as its own unit of work, or as part of the transaction it is called
+        # inside. The cursor is returned so lastrowid can be read
+
+    @contextmanager
+    def transaction(self):
+        conn = self.connection()
+        if conn.in_transaction:
+            depth = getattr(self.local, "depth", 0) + 1
+            self.local.depth = depth
+            self.execute(f"SAVEPOINT unit_{depth}")
+            try:
+                yield self
+                self.execute(f"RELEASE unit_{depth}")
+            except BaseException:
+                self.execute(f"ROLLBACK TO unit_{depth}")
+                self.execute(f"RELEASE unit_{depth}")
+                raise
+            finally:
+                self.local.depth = depth - 1
+            return
+        # a transaction inside another one is a savepoint, if it fails only its own statements are undone and the
+        # outer transaction decides whether everything is committed
+        self.execute("BEGIN IMMEDIATE")
+        try:
+            yield self
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        # with db.transaction(): runs every statement in the block on this thread's one connection and commits
+        # them together, or rolls all of them back if anything raises. IMMEDIATE takes the write lock at the
+        # start, so two writers can never both read and then try to write.
+
+    def commit(self):
+        self.connection().commit()
+
+    def rollback(self):
+        self.connection().rollback()
+
+
+db = Database()  # the instance that every screen uses
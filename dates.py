@@ -0,0 +1,38 @@
+from datetime import date, datetime, timedelta
+
+DISPLAY_FORMAT = "%d-%m-%Y"  # how dates are typed in and shown on screen
+STORAGE_FORMAT = "%Y-%m-%d"  # how due_date is stored, ISO-8601 text sorts in date order so it can be range scanned
+
+
+def today():
+    return date.today().isoformat()
+
+
+def future_date(days):
+    return (date.today() + timedelta(days=days)).isoformat()
+
+
+def to_storage(display_date):
+    return datetime.strptime(display_date, DISPLAY_FORMAT).date().isoformat()
+    # converts a DD-MM-YYYY date from a text input into the stored YYYY-MM-DD form
+
+
+def to_display(stored_date):
+    if not stored_date:
+        return ""
+    year, month, day = stored_date.split("-")
+    return f"{day}-{month}-{year}"
+    # converts a stored YYYY-MM-DD date back to DD-MM-YYYY without having to parse it with strptime
+
+
+def days_until(stored_date, from_date=None):
+    from_date = from_date or date.today()
+    return (date.fromisoformat(stored_date) - from_date).days
+
+
+def days_between(first_date, second_date):
+    return (date.fromisoformat(second_date) - date.fromisoformat(first_date)).days
+
+
+def add_days(stored_date, days):
+    return (date.fromisoformat(stored_date) + timedelta(days=days)).isoformat()
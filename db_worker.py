@@ -0,0 +1,55 @@
+import queue
+import threading
+import traceback
+
+from kivy.clock import Clock
+
+from database import db
+
+
+class DBWorker:  # runs database work on a background thread so the Kivy main thread never waits on SQLite
+    def __init__(self, database=db):
+        self.database = database
+        self.jobs = queue.Queue()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="db-worker", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.jobs.put(None)  # None tells run() to finish
+            self.thread.join()
+            self.thread = None
+
+    def submit(self, job, callback=None, error_callback=None):
+        self.start()
+        self.jobs.put((job, callback, error_callback))
+        # job is called with no arguments on the worker thread. Its return value is passed to callback, or the
+        # exception it raised is passed to error_callback, on the main thread during the next frame.
+        # Jobs run one at a time in the order they were submitted, so a read that is submitted after a write
+        # always sees that write.
+
+    def run(self):
+        while True:
+            item = self.jobs.get()
+            if item is None:
+                break
+            job, callback, error_callback = item
+            try:
+                result = job()
+            except Exception as error:
+                if error_callback is not None:
+                    Clock.schedule_once(lambda dt, e=error, f=error_callback: f(e))
+                else:
+                    traceback.print_exc()
+                continue
+            if callback is not None:
+                Clock.schedule_once(lambda dt, r=result, f=callback: f(r))
+        self.database.release()
+        # hands the worker's connection back to the pool once the thread stops
+
+
+worker = DBWorker()  # the worker that every screen submits its database work to
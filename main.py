@@ -1,60 +1,33 @@
+from startup import startup_timer  # imported first so the start up time includes every other import
 import sqlite3
 from kivy.app import App
 from kivy.uix.screenmanager import Screen, ScreenManager, NoTransition
 from kivy.uix.widget import Widget
 from kivy.uix.button import Button
+from kivy.uix.label import Label
 from kivy.config import Config
-from kivy.properties import Property, StringProperty, ListProperty, DictProperty
+from kivy.clock import Clock
+from kivy.properties import Property, StringProperty, ListProperty, DictProperty, ObjectProperty, NumericProperty, \
+    BooleanProperty
 from kivy.utils import get_color_from_hex
-import hashlib
-from datetime import datetime, timedelta
-from plyer import notification
+from database import db
+from db_worker import worker
+from session import session
+from categories import category_cache
+from tasks import task_repository
+from recurrences import recurrence_repository, merge_rows, moved_occurrence_id, parse_occurrence_id, \
+    UNITS
+from migrations import migrate
+from reminders import reminders
+import queries
+import dates
+from profiler import profiler
+from validation import validate_task, validate_repeat
+from services import services, ServiceError
 
 Config.set('graphics', 'width', '360')
 Config.set('graphics', 'height', '640')
 
-def get_today_date():
-    return datetime.today().strftime("%d-%m-%Y")
-
-def get_future_date(days):
-    return (datetime.today() + timedelta(days=days)).strftime("%d-%m-%Y")
-
-def check_due_tasks(user_id):
-    today = get_today_date()
-    tomorrow = get_future_date(1)
-    three_days = get_future_date(3)
-
-    conn = sqlite3.connect("task_manager.db")
-    cur = conn.cursor()
-    cur.execute("SELECT title, due_date FROM tasks WHERE user_id = ? AND due_date IN (?, ?, ?) AND status = 'pending'",
-                (user_id, today, tomorrow, three_days))
-    tasks = cur.fetchall()
-    conn.close()
-
-    if tasks:
-        for title, due_date in tasks:
-            due_date_obj = datetime.strptime(due_date, "%d-%m-%Y").date()
-            today_obj = datetime.strptime(today, "%d-%m-%Y").date()
-            # converts dates to objects so that any problems with time (as in a few hours difference)
-            days_left = (due_date_obj - today_obj).days
-
-            if days_left == 0:
-                message = f"'{title}' is due today."
-            elif days_left == 1:
-                message = f"'{title}' is due tomorrow."
-            else:
-                message = f"'{title}' is due in 3 days."
-
-            notification.notify(
-                title="Task Reminder",
-                message=message,
-                app_name="TaskSphere"
-            )
-        print(f"Notification sent: {message}")
-    else:
-        print("No due tasks found.")
-    return
-
 class Theme(Widget):
     colors = DictProperty({  # Creates dictionary to hold theme colours
         "background": get_color_from_hex("#FFFFFF"),  # White
@@ -71,51 +44,36 @@ class Theme(Widget):
     })
 
 
-initcon = sqlite3.connect("task_manager.db")
-initcur = initcon.cursor()
-initcur.execute("""
-CREATE TABLE IF NOT EXISTS Users (
-    user_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    username TEXT NOT NULL UNIQUE,
-    password_hash TEXT NOT NULL,
-    logged_in INTEGER DEFAULT 0
-    )
-""")
-
-initcur.execute("""
-CREATE TABLE IF NOT EXISTS Categories (
-    category_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER NOT NULL,
-    category_name TEXT NOT NULL,
-    FOREIGN KEY (user_id) REFERENCES Users (user_id)
-)    
-""")
-
-initcur.execute("""
-CREATE TABLE IF NOT EXISTS Tasks (
-    task_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER NOT NULL,
-    category_id INTEGER,
-    title TEXT NOT NULL,
-    description TEXT,
-    due_date TEXT,
-    priority INTEGER NOT NULL,
-    status TEXT DEFAULT 'pending',
-    FOREIGN KEY (user_id) REFERENCES Users (user_id),
-    FOREIGN KEY (category_id) REFERENCES Categories (category_id)
-)
-""")
-
-initcon.commit()
-initcon.close()
-
 
 class sm(ScreenManager):  # defines sm class which inherits from ScreenManager, which manages screens in the app
-    pass
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.factories = {}  # screen name -> the class that creates it, for screens that have not been created yet
+
+    def register(self, name, factory):
+        self.factories[name] = factory
+        # the screen is only created the first time it is opened or looked up, so its widgets are not built at
+        # start up
+
+    def get_screen(self, name):
+        factory = self.factories.pop(name, None)
+        if factory is not None:
+            self.add_widget(factory(name=name))
+        return super().get_screen(name)
+        # setting current also calls get_screen(), so opening a screen creates it first if it is needed
 
 
 class BaseScreen(Screen):
-    pass
+    def dispatch(self, event_type, *args, **kwargs):
+        if profiler.enabled and event_type in ("on_pre_enter", "on_enter"):
+            with profiler.timer(f"{self.name} {event_type}"):
+                return super().dispatch(event_type, *args, **kwargs)
+        return super().dispatch(event_type, *args, **kwargs)
+        # times every screen's on_pre_enter and on_enter when profiling is turned on
+
+
+class LoadingScreen(BaseScreen):  # shown for the first frame while the database worker finds the logged in user
+    message = StringProperty("Loading...")  # replaced with the error if the database could not be opened
 
 
 class ChooseScreen(BaseScreen):
@@ -132,46 +90,47 @@ class LoginScreen(BaseScreen):
         pass_input.text = ""
 
     def login_form(self, login_username, login_password):
+        self.ids.feedback_label.text = "Logging in..."
+        worker.submit(lambda: self.log_in(login_username, login_password), self.on_login_checked, self.on_failed)
+        # the password check and the update run on the database worker, on_login_checked() is then called with
+        # the result on the main thread
+
+    def log_in(self, login_username, login_password):  # runs on the database worker
+        user_id = self.password_validation(login_username, login_password)
+        if not user_id:
+            return False
+        session.log_in(user_id)
+        # the session remembers the user, so no screen has to search the Users table for them again
+        return True
+
+    def on_login_checked(self, logged_in):
         login_feedback_message = self.ids.feedback_label  # this creates an instance of the feedback label that is
         # created in my kv file
-        if self.password_validation(login_username, login_password):
-            conn = sqlite3.connect("task_manager.db")
-            cur = conn.cursor()
-            cur.execute("UPDATE Users SET logged_in = 0")  # this makes sure that all other users that might be logged
-            # in are logged out to prevent more than one user from being logged in
-            cur.execute("UPDATE Users SET logged_in = 1 WHERE username = ?", (login_username,))
-            # this sets the user that has been logged in to have a logged_in value of 1
-            conn.commit()
+        if logged_in:
             login_feedback_message.text = "Login successful!"  # outputs confirmation message
             login_feedback_message.color = (0, 1, 0, 1)
             self.manager.current = "main"  # changes screen to main screen
+            reminders.start(session.user_id)  # starts checking the new user's due tasks in the background
             return True
         else:
             login_feedback_message.text = "Invalid username or password"  # outputs error message
             login_feedback_message.color = (1, 0, 0, 1)
             return False
 
+    def on_failed(self, error):
+        feedback_label = self.ids.feedback_label
+        feedback_label.text = f"Could not log in: {error}"
+        feedback_label.color = (1, 0, 0, 1)
+        # replaces "Logging in..." if the worker could not check the password, so the user can try again
+
     def password_validation(self, login_username, login_password):  # function to check the login details against the
         # Users table
-        conn = None
-        try:  # tries to connect to the database use the username parameter to find a password that matches
-            conn = sqlite3.connect("task_manager.db")
-            cur = conn.cursor()
-            cur.execute("SELECT password_hash FROM Users WHERE username = ?", (login_username,))
-            result = cur.fetchone()  # stores the password that has been fetched
-
-            if result:
-                stored_password_hash = result[0]
-                input_password_hash = hashlib.sha256(login_password.encode()).hexdigest()
-                return stored_password_hash == input_password_hash  # returns True if the hash of the inputted
-                # password matches the stored hash related to the username
-            else:
-                return False  # otherwise returns false
-        except sqlite3.Error:  # returns false if there is a database error (indicating username is not in the table)
+        try:
+            return services.log_in(login_username, login_password) or False
+            # returns the user's id if the password matches the stored hash related to the username, and also
+            # upgrades old hashes
+        except sqlite3.Error:  # returns false if there is a database error
             return False
-        finally:  # closes the database connection regardless of the result
-            if conn:
-                conn.close()
 
 
 class SignupScreen(BaseScreen):
@@ -184,95 +143,52 @@ class SignupScreen(BaseScreen):
         pass_input.text = ""
         # Sets inputs and feedback label to be blank
 
-    def username_validation(self, signup_username):
-        if len(signup_username) < 4:
-            return False, "Username must be 4+ characters."  # If the username is less than 4 characters long,
-            # the validation fails and the method returns both False and a message.
-
-        uval_conn = sqlite3.connect("task_manager.db")
-        uval_cur = uval_conn.cursor()
-        uval_cur.execute("SELECT username FROM Users WHERE username = ?", (signup_username,))
-        dup_username = uval_cur.fetchone()
-        # this code checks if there is a username that is equal, and if so stores this value as a variable so the
-        # connection can be closed.
-        uval_conn.commit()
-        uval_conn.close()
-
-        if dup_username:
-            return False, "Username taken."  # if fetchone() returns a result, the username is taken.
-        return True, None  # If the username passes validation, the function returns True.
-
-    def password_validation(self, signup_password):
-        special_characters = "!£$%^&*()@"  # Defines the set of special characters that must be present in the password
-
-        if len(signup_password) < 8:
-            return False, "Password must be at least 8 characters long."
-            # Returns false if password is too short
-        if not any(char.isupper() for char in signup_password):
-            return False, "Password must contain at least one uppercase letter."
-            # returns false if password does not contain an uppercase character
-        if not any(char.isdigit() for char in signup_password):
-            return False, "Password must contain at least one digit."
-            # Returns false if password does not contain a numerical digit
-        if not any(char in special_characters for char in signup_password):
-            return False, "Password must contain at least one special character."
-            # Returns false if password does not contain a special character
+    def signup_validation(self, signup_username, signup_password):
+        worker.submit(lambda: self.sign_up(signup_username, signup_password), self.on_signed_up, self.on_failed)
+        # the username and password checks, the password hash and the inserts all run on the database worker, so
+        # the slow hash never holds up a frame
 
+    def sign_up(self, signup_username, signup_password):  # runs on the database worker
+        try:
+            services.sign_up(signup_username, signup_password)
+        except ServiceError as error:
+            return False, str(error)
+            # the message from whichever check failed, or "Username taken."
         return True, None
+        # the user and their "None" category are added in one transaction (see services.py)
 
-    def populate_users(self, username, password_hash):
-        conn = sqlite3.connect("task_manager.db")
-        cur = conn.cursor()
-        cur.execute("INSERT INTO Users (username, password_hash) VALUES (?, ?)", (username, password_hash))
-        conn.commit()
-        # signs user up
-        user_id = self.get_userid(username)
-        cur.execute("INSERT INTO Categories (category_name, user_id) VALUES ('None', ?)", (user_id,))
-        # adds "None" to the Categories table
-        conn.commit()
-        conn.close()
-
-    def signup_validation(self, signup_username, signup_password):
-        signup_feedback_label = self.ids.feedback_label  # Creates an instance of the feedback_label ID from my .kv file
-        usnm_valid, usnm_message = self.username_validation(signup_username)
-        # Passes values into username_validation() to get the return values
-        pass_valid, message = self.password_validation(signup_password)
-        # Passes values into password_validation() to get the return values
-        password_hash = hashlib.sha256(signup_password.encode()).hexdigest()
-        # Hashes the inputted password
-        if not usnm_valid:
-            signup_feedback_label.text = usnm_message
-            signup_feedback_label.color = (1, 0, 0, 1)
-            return
-            # Displays error message if username validation failed
-        elif not pass_valid:
-            signup_feedback_label.text = message
-            signup_feedback_label.color = (1, 0, 0, 1)
-            return
-            # Displays error message if password validation failed
-        else:
-            self.populate_users(signup_username, password_hash)
-            # Populates the database with values if they are valid
+    def on_signed_up(self, result):
+        signed_up, message = result
+        if signed_up:
             self.manager.current = "login"
             # Changes to current screen to the login screen if the signup was successful
+        else:
+            signup_feedback_label = self.ids.feedback_label  # Creates an instance of the feedback_label ID
+            signup_feedback_label.text = message
+            signup_feedback_label.color = (1, 0, 0, 1)
+            # Displays the error message if username or password validation failed
 
-    def get_userid(self, username):
-        conn = sqlite3.connect("task_manager.db")
-        cur = conn.cursor()
-        cur.execute("SELECT user_id FROM Users WHERE username = ?", (username,))
-        result = cur.fetchone()
-        user_id = result[0]
-        return user_id
+    def on_failed(self, error):
+        feedback_label = self.ids.feedback_label
+        feedback_label.text = f"Could not sign up: {error}"
+        feedback_label.color = (1, 0, 0, 1)
+        # for errors other than a failed check, for example if the database could not be written to
 
 
 class MainScreen(BaseScreen):
-    def log_out(self, ):
-        conn = sqlite3.connect("task_manager.db")
-        cur = conn.cursor()
-        cur.execute("UPDATE Users SET logged_in = 0")  # Logs out any logged in users when the method is called
-        conn.commit()
-        conn.close()
-        self.manager.current = "choosescreen"  # Changes current screen to the ChooseScreen
+    pending_count = NumericProperty(0)  # the dashboard counts, shown in the labels on the home screen
+    today_count = NumericProperty(0)
+    overdue_count = NumericProperty(0)
+
+    def on_pre_enter(self):
+        user_id = session.user_id
+        worker.submit(lambda: services.task_stats(user_id), self.show_stats)
+        # the counts are read from the TaskStats counters on the database worker, which does not count any tasks
+
+    def show_stats(self, stats):
+        self.pending_count = stats["pending"]
+        self.today_count = stats["today"]
+        self.overdue_count = stats["overdue"]
 
 
 class CreateTask(BaseScreen):
@@ -293,47 +209,15 @@ class CreateTask(BaseScreen):
         self.ids.category_spinner.text = "Select Category"
         # Ensures that no category is selected
 
+        self.ids.repeat_spinner.text = "Does not repeat"
+        self.ids.repeat_every_input.text = "1"
+        # new tasks are one-off unless the user picks how often they repeat
+
         self.get_categories()
 
     def created_task_validation(self, inp_title, inp_date, inp_descr, inp_category, inp_priority):
-        if not inp_title.strip():
-            return False, "Title cannot be empty"
-
-        if len(inp_title) > 30:
-            return False, "Title must be less than 30 characters."
-
-        if len(inp_descr) > 200:
-            return False, "Description must be less than 200 characters."
-
-        try:
-            datetime.strptime(inp_date, "%d-%m-%Y")
-        except ValueError:
-            return False, "Due date must be in format DD-MM-YYYY."
-
-        if inp_category == "Select Category":
-            return False, "Please select a category."
-
-        if inp_priority is None:
-            return False, "Please select a priority."
-
-        return True, None
-
-    def get_logged_in(self):
-        conn = sqlite3.connect("task_manager.db")
-        cur = conn.cursor()
-        cur.execute("SELECT user_id FROM Users WHERE logged_in = 1 LIMIT 1")  # Gets user_ID of a user that is logged in
-        result = cur.fetchone()
-        user_id = result[0]  # the actual integer is now returned
-        return user_id
-
-    def get_category_id(self, category_name, user_id):
-        conn = sqlite3.connect("task_manager.db")
-        cur = conn.cursor()
-        cur.execute("SELECT category_id FROM categories WHERE category_name = ? AND user_id = ?",
-                    (category_name, user_id))
-        result = cur.fetchone()
-        category_id = result[0]
-        return category_id
+        return validate_task(inp_title, inp_date, inp_descr, inp_category, inp_priority)
+        # the rules are in validation.py so the bulk import checks tasks in exactly the same way
 
     def get_priority(self):
         if self.ids.low_priority.active:
@@ -343,16 +227,6 @@ class CreateTask(BaseScreen):
         elif self.ids.high_priority.active:
             return 3
 
-    def insert_task(self, inp_title, inp_date, inp_descr, inp_priority, category_id, user_id):
-        conn = sqlite3.connect("task_manager.db")
-        cur = conn.cursor()
-        cur.execute("""
-                INSERT INTO Tasks (user_id, category_id, title, description, due_date, priority, status)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (user_id, category_id, inp_title, inp_descr, inp_date, inp_priority, "pending"))
-        conn.commit()
-        conn.close()
-
     def convert_priority(self):
         if self.get_priority() == 1:
             return "Low"
@@ -367,96 +241,132 @@ class CreateTask(BaseScreen):
         inp_descr = self.ids.description_input.text
         inp_category = self.ids.category_spinner.text
         inp_priority = self.get_priority()
+        inp_unit = UNITS.get(self.ids.repeat_spinner.text)
+        inp_every = self.ids.repeat_every_input.text
         feedback_label = self.ids.feedback_label
 
-        print(inp_category)
         # all input values are stored as local variables
 
         valid, error_message = self.created_task_validation(inp_title, inp_date, inp_descr, inp_category, inp_priority)
+        if valid and inp_unit is not None:
+            valid, error_message = validate_repeat(inp_unit, inp_every)
         if not valid:
             feedback_label.text = error_message
             feedback_label.color = (1, 0, 0, 1)
             return
         # Input values are validated, and if they are not valid, the relevant message is displayed
 
-        user_id = self.get_logged_in()
-        # user_id is found by checking which user is logged in
-        category_id = self.get_category_id(inp_category, user_id)
-        # category_id is found by using the inputted category's name and user_id
+        priority_text = self.convert_priority()
+        feedback_label.text = "Saving..."
+        feedback_label.color = (0, 0, 0, 1)
+
+        def save():  # runs on the database worker
+            if inp_unit is not None:
+                return services.create_recurring_task(session.user_id, inp_title, inp_date, inp_descr, inp_category,
+                                                      inp_priority, inp_unit, inp_every)
+                # a repeating task is stored once as a series, and ViewTask shows its first occurrence
+            return services.create_task(session.user_id, inp_title, inp_date, inp_descr, inp_category, inp_priority)
+            # the service finds the category_id, stores the due date as YYYY-MM-DD and inserts the task, returning
+            # the task_id that the insert created and the category_id
+
+        def on_saved(result):
+            task_id, category_id = result
+            view_task_screen = self.manager.get_screen("view_task")
+            view_task_screen.task_title = inp_title
+            view_task_screen.task_due_date = inp_date
+            view_task_screen.task_description = inp_descr
+            view_task_screen.task_priority = priority_text
+            view_task_screen.task_status = "Pending"
+            view_task_screen.task_category_id = str(category_id)
+            view_task_screen.task_id = str(task_id)
+            # Sets all the View Task screen's properties to be the details that have just been inputted
+            self.manager.current = "view_task"
+            # Changes the current screen to be the View Task screen
+
+        def on_failed(error):
+            feedback_label.text = str(error)
+            feedback_label.color = (1, 0, 0, 1)
+            # the service rejected the task, for example because its category has just been deleted
 
-        self.insert_task(inp_title, inp_date, inp_descr, inp_priority, category_id, user_id)
-        # task is inserted into database
-
-        view_task_screen = self.manager.get_screen("view_task")
-        view_task_screen.task_title = self.ids.title_input.text
-        view_task_screen.task_due_date = self.ids.due_date_input.text
-        view_task_screen.task_description = self.ids.description_input.text
-        view_task_screen.task_priority = self.convert_priority()
-        view_task_screen.task_status = "Pending"
-        view_task_screen.task_category_id = str(category_id)
-        view_task_screen.task_id = str(self.get_task_id(inp_title, inp_date))
-        # Sets all the View Task screen's properties to be the details that have just been inputted
-        self.manager.current = "view_task"
-        # Changes the current screen to be the View Task screen
+        worker.submit(save, on_saved, on_failed)
 
 
     def get_categories(self):
-        user_id = self.get_logged_in()
+        user_id = session.user_id
         # finds the logged in user
-        conn = sqlite3.connect("task_manager.db")
-        cur = conn.cursor()
-        cur.execute("SELECT category_name FROM Categories WHERE user_id = ?", (user_id,))
-        conn.commit()
-        user_categories = cur.fetchall()
-        # stores all categories in this user_categories variable
-        conn.close()
-        self.categories = [cat[0] for cat in user_categories]
-        # adds every category in user_categories to the categories list property
-
-    def get_task_id(self, title, due_date):
-        conn = sqlite3.connect("task_manager.db")
-        cur = conn.cursor()
-        cur.execute("SELECT task_id FROM tasks WHERE title = ? AND due_date = ?", (title, due_date))
-        result = cur.fetchone()
-        task_id = result[0]
-        conn.close()
-        return task_id
+        if category_cache.is_loaded(user_id):
+            self.categories = category_cache.names(user_id)
+            # the spinner is filled straight from the category cache once it has been loaded
+        else:
+            worker.submit(lambda: category_cache.names(user_id), self.on_categories_loaded)
+            # the first time, the cache loads every category in one query on the database worker
+
+    def on_categories_loaded(self, categories):
+        self.categories = categories
+        # adds every category that was fetched to the categories list property
 
 
 class NavigationMenu(BaseScreen):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.buttons = {}  # category name -> its button in category_layout
+        self.buttons_version = None  # the user and category cache version that the buttons were made from
+        self.category_counts = {}  # category name -> pending tasks, shown on its button
+
     def on_enter(self):
         self.load_category_buttons()
         # Method is called when the screen opens
+        user_id = session.user_id
+        worker.submit(lambda: services.task_stats(user_id)["categories"], self.show_category_counts)
+        # the pending count of every category comes from one read of the TaskStats counters
+
+    def button_text(self, category_name):
+        count = self.category_counts.get(category_name)
+        return f"{category_name} ({count})" if count else category_name
+
+    def show_category_counts(self, counts):
+        self.category_counts = counts
+        for category_name, btn in self.buttons.items():
+            btn.text = self.button_text(category_name)
 
     def load_category_buttons(self):
-        self.ids.category_layout.clear_widgets()  # Removes all existing widgets from the layout
-        user_id = self.get_logged_in()  # Stores the logged in user_id
-
-        conn = sqlite3.connect("task_manager.db")
-        cur = conn.cursor()
-        cur.execute("SELECT category_name FROM Categories WHERE user_id = ?", (user_id,))
-        categories = cur.fetchall()
-        conn.close()
-        # Fetches all categories from the Categories table based on the user that is logged in
-
-        for category in categories:
-            category_name = category[0]
-            btn = Button(
-                text=category_name,
-                size_hint_y=None,
-                height=40,
-                on_press=lambda btn, cat_name=category_name: self.filter_tasks("category", cat_name)
-            )
-            self.ids.category_layout.add_widget(btn)
-        # Every category that has been fetched is created as a button on screen
-
-    def get_logged_in(self):
-        conn = sqlite3.connect("task_manager.db")
-        cur = conn.cursor()
-        cur.execute("SELECT user_id FROM Users WHERE logged_in = 1 LIMIT 1")  # Gets user_ID of a user that is logged in
-        result = cur.fetchone()
-        user_id = result[0]
-        return user_id
+        user_id = session.user_id  # Stores the logged in user_id
+        if category_cache.is_loaded(user_id):
+            if self.buttons_version != (user_id, category_cache.version):
+                self.show_category_buttons(category_cache.names(user_id))
+            # the buttons are only touched if a category has been added since they were made
+        else:
+            self.ids.category_layout.clear_widgets()  # Removes all existing widgets from the layout
+            self.buttons = {}
+            self.ids.category_layout.add_widget(Label(text="Loading...", size_hint_y=None, height=40))
+            # shows that the categories are loading until the database worker returns them
+            worker.submit(lambda: category_cache.names(user_id), self.show_category_buttons)
+            # Fetches all categories from the Categories table based on the user that is logged in
+
+    def show_category_buttons(self, categories):
+        layout = self.ids.category_layout
+        for child in list(layout.children):
+            if child not in self.buttons.values():
+                layout.remove_widget(child)  # Removes the loading label
+        names = set(categories)
+        for category_name in list(self.buttons):
+            if category_name not in names:
+                layout.remove_widget(self.buttons.pop(category_name))
+        # buttons for categories that no longer exist are removed
+        with profiler.measure("category buttons"):
+            for category_name in categories:
+                if category_name in self.buttons:
+                    continue
+                btn = Button(
+                    text=self.button_text(category_name),
+                    size_hint_y=None,
+                    height=40,
+                    on_press=lambda btn, cat_name=category_name: self.filter_tasks("category", cat_name)
+                )
+                layout.add_widget(btn)
+                self.buttons[category_name] = btn
+        # Only categories that do not have a button yet get one, the rest are left as they are
+        self.buttons_version = (session.user_id, category_cache.version)
 
     def filter_tasks(self, filter_type, category=None):
         task_list_screen = self.manager.get_screen('task_list_screen')
@@ -465,15 +375,10 @@ class NavigationMenu(BaseScreen):
         self.manager.current = 'task_list_screen'
         # Passes the filter into the task list screen so that correct tasks are displayed
 
-    def log_out(self):
-        conn = sqlite3.connect("task_manager.db")
-        cur = conn.cursor()
-        cur.execute(
-            "UPDATE Users SET logged_in = 0")  # Logs out any logged in users when the method is called
-        cur.execute("SELECT * FROM Users")
-        conn.commit()
-        conn.close()
-        self.manager.current = "choosescreen"  # Changes current screen to the ChooseScreen
+
+class TaskRow(Button):  # the reusable view for a single task in the TaskListScreen's RecycleView
+    task = ObjectProperty(None)
+    selected = BooleanProperty(False)  # highlighted while the task is selected for a bulk action
 
 
 class TaskListScreen(BaseScreen):
@@ -481,100 +386,335 @@ class TaskListScreen(BaseScreen):
     # completed, all) or category. and is set to all by default
     selected_category = StringProperty(None)  # This specifies the category that has been chosen, and is None for
     # status filters.
+    page_size = NumericProperty(50)  # how many tasks are fetched at a time
+    load_more_at = 0.1  # the next page is fetched once the list is scrolled to within 10% of the bottom
+    loading = BooleanProperty(False)  # True while a page is being fetched, which shows a loading label
+    error_text = StringProperty("")  # shown in the status label when a page or a bulk action fails
+    searching = BooleanProperty(False)  # True while the list shows search results instead of the filter
+    search_delay = 0.25  # seconds to wait after the last key press before searching
+    search_limit = 200  # the most search results that are shown, best matches first
+    selecting = BooleanProperty(False)  # True while pressing a task selects it instead of opening it
+    selected_count = NumericProperty(0)
+    categories = ListProperty([])  # the categories that selected tasks can be moved to
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.cursor = None  # where the last page that was fetched ended, the next page carries on after it
+        self.has_more = False
+        self.generation = 0  # increased every time the screen is entered so results for an old filter are ignored
+        self.rows = None  # every task for the current filter when it comes from the task repository
+        self.shown = 0  # how many of those rows are in the list so far
+        self.search_event = None  # the search that is waiting for the user to stop typing
+        self.selected = set()  # the task_ids that are selected for a bulk action
+        self.list_key = None  # the user, filter and date that the rows on screen were selected for
+        self.list_version = None  # the task repository version those rows were selected from
 
     def on_enter(self):
-        logged_in = self.get_logged_in()
-        # finds the user that is logged in
+        if self.selecting:
+            self.selecting = False
+            self.set_selected(set())
+        # a selection is not kept when the user leaves the list and comes back
+        user_id = session.user_id
+        if self.list_key == self.filter_key() and not self.searching and self.rows is not None and \
+                task_repository.is_loaded(user_id) and recurrence_repository.is_loaded(user_id):
+            if self.list_version != self.data_version():
+                self.apply_changes()
+            return
+        # coming back to the same filter leaves the list (and where it was scrolled to) as it is, and only the
+        # rows that have been added, changed or removed since are updated. After logging out the repositories are
+        # cleared, so the list is loaded again from the start instead
+
+        self.ids.search_input.text = ""  # each filter is opened without a search
+        self.searching = False
+        self.show_filter()
+
+    def data_version(self):
+        return task_repository.version, recurrence_repository.version
+
+    def filter_key(self):
+        return session.user_id, self.filter_type, self.selected_category, self.get_today_date()
+
+    def select_rows(self):
+        user_id, filter_type, category, today = self.filter_key()
+        category_id = category_cache.get_id(user_id, category) if filter_type == "category" else None
+        week_end = dates.future_date(7)
+        rows = task_repository.select(filter_type, category_id=category_id, today=today, week_end=week_end)
+        occurrences = recurrence_repository.occurrences(user_id, filter_type, category_id, today, week_end)
+        if occurrences:
+            rows = merge_rows(rows, occurrences, filter_type in ("overdue", "week"))
+        # repeating tasks are expanded only for the dates this filter covers and merged into the tasks in order
+        self.list_key, self.list_version = (user_id, filter_type, category, today), self.data_version()
+        return rows
+
+    def apply_changes(self):
+        rows = self.select_rows()
+        old_rows = {row["task"][0]: row for row in self.ids.task_list_layout.data}
+        shown = min(len(rows), max(self.shown, self.page_size))
+        data = []
+        for task in rows[:shown]:
+            row = old_rows.get(task[0])
+            data.append(row if row is not None and row["task"] == task else self.task_row(task))
+        # rows for tasks that have not changed are reused as they are, only new or changed tasks get a new row
+        self.ids.task_list_layout.data = data
+        self.rows = rows
+        self.shown = shown
+        self.has_more = shown < len(rows)
+
+    def clear_list(self):
+        self.generation += 1
+        self.cursor = None
+        self.rows = None
+        self.shown = 0
+        self.has_more = False
+        self.loading = False
+        self.error_text = ""
+        self.selected = set()
+        self.selected_count = 0
+        self.list_key = None
+        self.ids.task_list_layout.data = []
+        self.ids.task_list_layout.scroll_y = 1
+
+    def show_filter(self):
         filter_type = self.filter_type
         # calls the filter_type property to a local variable
         category = self.selected_category
         # calls the selected_category property to a local variable
 
-        user_id = self.get_logged_in()
-
-        query = "SELECT task_id, title, description, due_date, priority, status, category_id FROM Tasks"
-        # I have added the task_id to the Table search
-        params = []
-        # Creates the basic query that will be used to select tasks, and also creates an array to store any parameters
-
-        # I have changed all of my queries to contain a clause that orders tasks by priority descending
-        if filter_type == "category" and category:
-            category_id = self.get_category_id(self.selected_category, logged_in)
-            # finds the category id of the selected_category property, storing that to a local variable as well
-            query += " WHERE category_id = ? AND user_id = ? AND status = 'pending' ORDER BY priority DESC"
-            params.append(category_id)
-            params.append(user_id)
-        # Edits the query to search for tasks with a specific category, adds the category to the parameters array
-
-        elif filter_type == "today":
-            query += " WHERE due_date = ? AND user_id = ? AND status = 'pending' ORDER BY priority DESC"
-            params.append(self.get_today_date())
-            params.append(user_id)
-        # Edits the query to search for tasks that have a specific due date, making the parameter today's date
-
-        elif filter_type == "completed":
-            query += " WHERE status = ? AND user_id = ? ORDER BY priority DESC"
-            params.append("completed")
-            params.append(user_id)
-        # Edits the query to search for tasks with a specific status, making the parameter "completed"
-
-        elif filter_type == "all":
-            query += " WHERE user_id = ? AND status = 'pending' ORDER BY priority DESC"
-            params.append(user_id)
-        # No filtering, this just displays all tasks
-        # every query now has user_id as a parameter as well as whatever the old parameter was.
-
-        conn = sqlite3.connect("task_manager.db")
-        cur = conn.cursor()
-        cur.execute(query, tuple(params))
-        tasks = cur.fetchall()
-        conn.close()
-
-        task_list_layout = self.ids.task_list_layout
-        task_list_layout.clear_widgets()
-        # removes any widgets that might already be present
-
-        for task in tasks:
-            task_id, title, description, due_date, priority, status, category_id = task
-            task_button = Button(
-                text=f"{title}\nDue: {due_date} Priority: {self.get_priority_text(priority)}",
-                # \n makes sure there is a break after the title, so that the due date and priority are on a new line.
-                size_hint_y=None,
-                text_size=(self.width, None),
-                halign='left',
-                padding=[30, 10],
-                height=50,
-                on_press=lambda task_button, t=task: self.on_task_pressed(t[0], t[1], t[2], t[3], t[4], t[5], t[6])
-                # I have also passed the task_id into the on_task_pressed() method
-            )
-            task_list_layout.add_widget(task_button)
-        # Adds each task to the task_list_layout, with their title, due date, priority and status
+        self.clear_list()
+
+        user_id = session.user_id
+        if task_repository.is_loaded(user_id) and recurrence_repository.is_loaded(user_id) and \
+                (filter_type != "category" or category_cache.is_loaded(user_id)):
+            self.rows = self.select_rows()
+            self.has_more = True
+            self.show_next_rows()
+            return
+        # Once the user's tasks are held in the task repository, every filter is answered from memory without
+        # going to the database at all
+
+        self.loading = True
+        generation, page_size = self.generation, self.page_size
+        worker.submit(lambda: services.list_tasks(user_id, filter_type, category, page_size),
+                      lambda result: self.on_page_loaded(generation, result),
+                      lambda error: self.on_load_failed(generation, error))
+        # The first page is fetched on the database worker, so the screen is shown straight away with a loading
+        # label instead of waiting. The service picks the filter's query and merges in the repeating tasks. Later
+        # pages are only fetched when the user scrolls near the bottom of the list (see on_list_scroll).
+        worker.submit(lambda: (task_repository.load(user_id), recurrence_repository.load(user_id)))
+        # after the first page, all of the user's tasks (and repeating tasks) are loaded into memory for the next
+        # visit
+
+    def on_search_text(self, text):
+        if self.search_event is not None:
+            self.search_event.cancel()
+        self.search_event = Clock.schedule_once(lambda dt: self.search(text), self.search_delay)
+        # every key press restarts the wait, so only the text the user stops typing at is searched for
+
+    def search(self, text):
+        self.search_event = None
+        if not queries.search_words(text):
+            if self.searching:
+                self.searching = False
+                self.show_filter()
+            return
+        # clearing the search box goes back to the filter the screen was opened with
+
+        self.searching = True
+        self.clear_list()
+        self.loading = True
+        generation, user_id, limit = self.generation, session.user_id, self.search_limit
+        worker.submit(lambda: services.search_tasks(user_id, text, limit),
+                      lambda rows: self.on_search_loaded(generation, rows),
+                      lambda error: self.on_load_failed(generation, error))
+        # searches the titles and descriptions of all of the user's tasks (through the TaskSearch full text index)
+        # and repeating tasks
+
+    def on_search_loaded(self, generation, rows):
+        if generation != self.generation:
+            return
+        # the user has typed more (or left the screen) since this search was started
+        self.loading = False
+        self.rows = rows
+        self.show_next_rows()
+        # the results are already ranked, so they are shown a page at a time the same way as the task repository
+
+    def show_next_rows(self):
+        page = self.rows[self.shown:self.shown + self.page_size]
+        self.shown += len(page)
+        self.has_more = self.shown < len(self.rows)
+        with profiler.measure("task list rows"):
+            self.ids.task_list_layout.data.extend(self.task_row(task) for task in page)
+        # rows from the task repository are still added a page at a time, so opening a long list stays quick
+
+    def load_next_page(self):
+        if not self.has_more or self.loading:
+            return
+        if self.rows is not None:
+            self.show_next_rows()
+            return
+        user_id, filter_type, category = session.user_id, self.filter_type, self.selected_category
+        cursor, page_size, generation = self.cursor, self.page_size, self.generation
+        self.loading = True
+        worker.submit(lambda: services.list_tasks(user_id, filter_type, category, page_size, cursor),
+                      lambda result: self.on_page_loaded(generation, result),
+                      lambda error: self.on_load_failed(generation, error))
+        # the next page is found by carrying on from the last task that was fetched rather than counting rows with
+        # OFFSET, so every page is as quick to fetch as the first one
+
+    def on_load_failed(self, generation, error):
+        if generation != self.generation:
+            return
+        self.loading = False
+        self.error_text = f"Could not load the tasks: {error}"
+        # takes the loading label away, so the list does not look like it is still waiting for the page
+
+    def on_page_loaded(self, generation, result):
+        if generation != self.generation:
+            return
+        # the screen has been entered again since this page was requested, so it belongs to an old filter
+        tasks, self.cursor = result
+        self.loading = False
+        self.has_more = self.cursor is not None
+        # the service only returns a cursor when the page was full, so there may be more tasks to fetch
+
+        with profiler.measure("task list rows"):
+            self.ids.task_list_layout.data.extend(self.task_row(task) for task in tasks)
+        # The task list is a RecycleView, so it is given a plain list of dictionaries instead of one button per task.
+        # It only creates TaskRow widgets for the rows that are on screen and reuses them while scrolling.
+
+    def on_list_scroll(self, scroll_y):
+        if scroll_y <= self.load_more_at:
+            self.load_next_page()
+        # scroll_y is 1 at the top of the list and 0 at the bottom
+
+    def task_row(self, task):
+        task_id, title, due_date, priority, status, category_id = task
+        repeats = " (repeats)" if parse_occurrence_id(task_id) else ""
+        return {
+            "text": f"{title}{repeats}\nDue: {dates.to_display(due_date)} Priority: {self.get_priority_text(priority)}",
+            # \n makes sure there is a break after the title, so that the due date and priority are on a new line.
+            "task": task,
+            # the whole row is kept so that the TaskRow can pass it (including the task_id) to on_task_pressed()
+            "selected": task_id in self.selected,
+        }
+
+    def toggle_selecting(self):
+        self.selecting = not self.selecting
+        self.error_text = ""
+        self.set_selected(set())
+        if self.selecting:
+            user_id = session.user_id
+            if category_cache.is_loaded(user_id):
+                self.categories = category_cache.names(user_id)
+            else:
+                worker.submit(lambda: category_cache.names(user_id), lambda names: setattr(self, "categories", names))
+        # selection mode is turned on and off by the Select button, the categories are needed for Move to
+
+    def set_selected(self, selected):
+        self.error_text = ""
+        self.selected = selected
+        self.selected_count = len(selected)
+        for row in self.ids.task_list_layout.data:
+            row["selected"] = row["task"][0] in selected
+        self.ids.task_list_layout.refresh_from_data()
+
+    def toggle_task(self, task_id):
+        if task_id in self.selected:
+            self.selected.discard(task_id)
+        else:
+            self.selected.add(task_id)
+        self.selected_count = len(self.selected)
+        for row in self.ids.task_list_layout.data:
+            if row["task"][0] == task_id:
+                row["selected"] = task_id in self.selected
+                break
+        self.ids.task_list_layout.refresh_from_data()
+        # only the pressed row changes, the rest of the list is left as it is
+
+    def bulk_complete(self):
+        task_ids, user_id = list(self.selected), session.user_id
+        if task_ids:
+            worker.submit(lambda: services.complete_tasks(user_id, task_ids),
+                          lambda done: self.update_rows(done, status="completed"), self.on_bulk_failed)
+
+    def bulk_delete(self):
+        task_ids, user_id = list(self.selected), session.user_id
+        if task_ids:
+            worker.submit(lambda: services.delete_tasks(user_id, task_ids),
+                          lambda done: self.remove_rows(done, whole_series=True), self.on_bulk_failed)
+
+    def bulk_move(self, category):
+        task_ids, user_id = list(self.selected), session.user_id
+        if task_ids and category in self.categories:
+            worker.submit(lambda: services.move_tasks(user_id, task_ids, category),
+                          lambda category_id: self.update_rows(task_ids, category_id=category_id,
+                                                               category=category), self.on_bulk_failed)
+        # each bulk action is one statement in one transaction on the database worker (see TaskRepository)
+
+    def on_bulk_failed(self, error):
+        self.error_text = f"Could not update the tasks: {error}"
+        # the transaction was rolled back, so the rows on screen are still right and stay selected for another try
+
+    def update_rows(self, task_ids, status=None, category_id=None, category=None):
+        task_ids = set(task_ids)
+        completed_away = status == "completed" and self.filter_type != "completed"
+        moved_away = category is not None and self.filter_type == "category" and category != self.selected_category
+        if (completed_away or moved_away) and not self.searching:
+            self.remove_rows(task_ids)
+            return
+        # tasks that no longer belong in the filter are taken out of the list
+
+        def changed(task):
+            task_id, title, due_date, priority, old_status, old_category_id = task
+            return (task_id, title, due_date, priority, status or old_status,
+                    old_category_id if category_id is None else category_id)
+
+        for row in self.ids.task_list_layout.data:
+            if row["task"][0] in task_ids:
+                row["task"] = changed(row["task"])
+        if self.rows is not None:
+            self.rows = [changed(task) if task[0] in task_ids else task for task in self.rows]
+        self.finish_bulk_action()
+        # search results show every task, so they stay in the list with their new status or category
+
+    def remove_rows(self, task_ids, whole_series=False):
+        task_ids = set(task_ids)
+        series = {parse_occurrence_id(task_id)[0] for task_id in task_ids if parse_occurrence_id(task_id)}
+
+        def removed(task):
+            occurrence = parse_occurrence_id(task[0])
+            return task[0] in task_ids or (whole_series and occurrence is not None and occurrence[0] in series)
+        # deleting a repeating task deletes its series, so every one of its occurrences leaves the list
+
+        layout = self.ids.task_list_layout
+        layout.data = [row for row in layout.data if not removed(row["task"])]
+        if self.rows is not None:
+            self.shown -= sum(1 for task in self.rows[:self.shown] if removed(task))
+            self.rows = [task for task in self.rows if not removed(task)]
+        self.finish_bulk_action()
+        # the rows are removed from the list that is on screen, the tasks are not fetched again
+
+    def finish_bulk_action(self):
+        self.selecting = False
+        self.set_selected(set())
+        if self.list_key is not None:
+            self.list_version = task_repository.version, self.list_version[1]
+        # the list has already been changed to match, so the next visit does not need to look again. Repeating
+        # tasks are still looked at again, as completing one can make its next occurrence due
 
     def get_today_date(self):
-        return datetime.today().strftime('%d-%m-%Y')
-
-    def get_category_id(self, category_name, user_id):
-        conn = sqlite3.connect("task_manager.db")
-        cur = conn.cursor()
-        cur.execute("SELECT category_id FROM categories WHERE category_name = ? AND user_id = ?",
-                    (category_name, user_id))
-        result = cur.fetchone()
-        category_id = result[0]
-        return category_id
-
-    def get_logged_in(self):
-        conn = sqlite3.connect("task_manager.db")
-        cur = conn.cursor()
-        cur.execute("SELECT user_id FROM Users WHERE logged_in = 1 LIMIT 1")  # Gets user_ID of a user that is logged in
-        result = cur.fetchone()
-        user_id = result[0]
-        return user_id
-
-    def on_task_pressed(self, task_id, title, description, due_date, priority, status, category_id):
+        return dates.today()
+
+    def on_task_pressed(self, task_id, title, due_date, priority, status, category_id):
+        if self.selecting:
+            self.toggle_task(task_id)
+            return
+        # in selection mode pressing a task selects it instead of opening it
         view_task_screen = self.manager.get_screen("view_task")
         view_task_screen.task_title = title
-        view_task_screen.task_description = description
-        view_task_screen.task_due_date = due_date
+        view_task_screen.task_description = ""
+        # the description is not part of the task list, ViewTask loads it when it opens
+        view_task_screen.task_due_date = dates.to_display(due_date)
         view_task_screen.task_priority = self.get_priority_text(priority)
         # sets the task_priority property to be the string that is fetched when the get_priority_text method is called.
         view_task_screen.task_status = status
@@ -603,43 +743,56 @@ class ViewTask(BaseScreen):
     task_category_name = StringProperty("")
     task_id = StringProperty("")
     # Here I created the task_id as a property in the View Task screen
+    error_text = StringProperty("")  # shown above the buttons if loading, completing or deleting the task fails
 
     def on_enter(self):
-        cat_name = self.get_cat_name(self.task_category_id)
+        self.error_text = ""
+        task_id, cat_id = self.task_id, self.task_category_id
+        if category_cache.is_loaded(session.user_id):
+            self.task_category_name = self.get_cat_name(cat_id)
+            # the category name comes straight from the category cache once it has been loaded
+        else:
+            self.task_category_name = "Loading..."
+        worker.submit(lambda: (self.get_description(task_id), self.get_cat_name(cat_id)),
+                      lambda result: self.on_details_loaded(task_id, result),
+                      lambda error: setattr(self, "error_text", f"Could not load the task: {error}"))
+        # the description (and the category name if the cache is not loaded yet) are fetched on the database
+        # worker while the rest of the task is shown
+
+    def on_details_loaded(self, task_id, result):
+        if task_id != self.task_id:
+            return
+        # the user has opened a different task since these details were asked for
+        description, cat_name = result
+        self.task_description = description or ""
         self.task_category_name = cat_name
 
     def mark_completed(self, task_id):
-        conn = sqlite3.connect("task_manager.db")
-        cur = conn.cursor()
-        cur.execute("UPDATE Tasks SET status = 'completed' WHERE task_id = ? ", (int(task_id),))
-        # This query now uses task_id instead of title
-        conn.commit()
-        conn.close()
-        # Changes the status of the current task to "completed".
-
-        self.manager.current = "nav_menu"
+        user_id = session.user_id
+        worker.submit(lambda: services.complete_task(user_id, task_id), self.return_to_menu, self.on_failed)
+        # This uses task_id instead of title
+        # Changes the status of the current task to "completed", in the database and in the task repository
 
     def delete_task(self, task_id):
-        conn = sqlite3.connect("task_manager.db")
-        cur = conn.cursor()
-        cur.execute("DELETE FROM Tasks WHERE task_id = ?", (int(task_id),))
-        # This query now uses task_id instead of title
-        conn.commit()
-        conn.close()
-        # Deletes the task from the table
+        user_id = session.user_id
+        worker.submit(lambda: services.delete_task(user_id, task_id), self.return_to_menu, self.on_failed)
+        # This uses task_id instead of title
+        # Deletes the task from the table and from the task repository
 
+    def return_to_menu(self, result):
         self.manager.current = "nav_menu"
+        # only called once the write has finished, so the task list never shows the task as it was before
+
+    def on_failed(self, error):
+        self.error_text = f"Could not update the task: {error}"
+        # the user stays on the task so they can try again or go back
+
+    def get_description(self, task_id):
+        return services.task_description(session.user_id, task_id)
 
     def get_cat_name(self, cat_id):
-        conn = sqlite3.connect("task_manager.db")
-        cur = conn.cursor()
-        cur.execute("SELECT category_name FROM Categories WHERE category_id = ?", ((int(cat_id)),))
-        # Query to find the category name that matches the ID that is passed in
-        result = cur.fetchone()
-        cat_name = result[0]
-        conn.commit()
-        conn.close()
-        return cat_name
+        return category_cache.get_name(session.user_id, int(cat_id))
+        # finds the category name that matches the ID that is passed in from the category cache
 
 
 class EditTaskScreen(BaseScreen):
@@ -651,74 +804,50 @@ class EditTaskScreen(BaseScreen):
     task_category = StringProperty("")
     task_id = StringProperty("")
     # I have added task_id as a property in the Edit Task screen
+    details_loaded = BooleanProperty(False)  # Confirm is disabled until the description and category have arrived
 
     def on_enter(self):
         self.get_categories()
 
-    def retrieve_details(self, task_id, title, due_date, description, priority):
+    def retrieve_details(self, task_id, title, due_date, priority):
         self.task_id = task_id
         # task_id property is changed to be the correct task_id
         self.task_title = title
-        self.task_description = description
         self.task_due_date = due_date
         self.task_priority = priority
-        self.task_category = self.get_category(self.task_id)
-
-    # Sets properties to be the values passed in
-
-    def get_category(self, task_id):
-        conn = sqlite3.connect("task_manager.db")
-        cur = conn.cursor()
-        cur.execute("SELECT category_id FROM Tasks WHERE task_id = ?", (task_id,))
-        # This query now uses task_id instead of title
-        result = cur.fetchone()
-        cat_id = result[0]
-        # Finds the category_id of the task
-        cur.execute("SELECT category_name FROM Categories WHERE category_id = ?", (cat_id,))
-        result2 = cur.fetchone()
-        cat_name = result2[0]
-        # finds the category name that matches the category ID and returns it
-        return cat_name
-
-    def edit_task_validation(self, inp_title, inp_date, inp_descr, inp_category, inp_priority):
-        if not inp_title.strip():
-            return False, "Title cannot be empty"
-
-        if len(inp_title) > 30:
-            return False, "Title must be less than 30 characters."
-
-        if len(inp_descr) > 200:
-            return False, "Description must be less than 200 characters."
-
-        try:
-            datetime.strptime(inp_date, "%d-%m-%Y")
-        except ValueError:
-            return False, "Due date must be in format DD-MM-YYYY."
-
-        if inp_category == "Select Category":
-            return False, "Please select a category."
+        # Sets properties to be the values passed in
+        self.task_description = ""
+        self.task_category = ""
+        self.details_loaded = False
+        self.ids.feedback_label.text = "Loading..."
+        self.ids.feedback_label.color = (0, 0, 0, 1)
+        worker.submit(lambda: self.get_details(task_id), lambda details: self.on_details_loaded(task_id, details),
+                      self.on_details_failed)
+        # the description and category are fetched here rather than passed in from the View Task screen, so the
+        # previous task's category (or a description that has not loaded yet) can never be saved over this task
+
+    def on_details_loaded(self, task_id, details):
+        if task_id != self.task_id:
+            return
+        # another task has been opened for editing since these details were asked for
+        self.task_description, self.task_category = details
+        self.details_loaded = True
+        self.ids.feedback_label.text = ""
 
-        if inp_priority is None:
-            return False, "Please select a priority."
+    def on_details_failed(self, error):
+        feedback_label = self.ids.feedback_label
+        feedback_label.text = f"Could not load the task: {error}"
+        feedback_label.color = (1, 0, 0, 1)
 
-        return True, None
+    def get_details(self, task_id):  # runs on the database worker
+        task = services.get_task(session.user_id, task_id)
+        # Finds the task (or the series, for a repeating task), using task_id instead of title
+        return task[6] or "", category_cache.get_name(session.user_id, task[5])
+        # the description, and the category name that matches the category ID in the category cache
 
-    def get_logged_in(self):
-        conn = sqlite3.connect("task_manager.db")
-        cur = conn.cursor()
-        cur.execute("SELECT user_id FROM Users WHERE logged_in = 1 LIMIT 1")  # Gets user_ID of a user that is logged in
-        result = cur.fetchone()
-        user_id = result[0]  # the actual integer is now returned
-        return user_id
-
-    def get_category_id(self, category_name, user_id):
-        conn = sqlite3.connect("task_manager.db")
-        cur = conn.cursor()
-        cur.execute("SELECT category_id FROM categories WHERE category_name = ? AND user_id = ?",
-                    (category_name, user_id))
-        result = cur.fetchone()
-        category_id = result[0]
-        return category_id
+    def edit_task_validation(self, inp_title, inp_date, inp_descr, inp_category, inp_priority):
+        return validate_task(inp_title, inp_date, inp_descr, inp_category, inp_priority)
+        # the rules are in validation.py so the bulk import checks tasks in exactly the same way
 
     def get_priority(self):
         if self.ids.low_priority.active:
@@ -736,17 +865,9 @@ class EditTaskScreen(BaseScreen):
         elif self.get_priority() == 3:
             return "High"
 
-    def update_task(self, new_title, due_date, description, priority, category_id, user_id):
-        conn = sqlite3.connect("task_manager.db")
-        cur = conn.cursor()
-        cur.execute("UPDATE Tasks SET title = ?, due_date = ?, description = ?, priority = ?, category_id = ? WHERE "
-                    "task_id = ? AND user_id = ?", (new_title, due_date, description, priority, category_id,
-                                                  self.task_id, user_id))
-        # This query now uses task_id instead of title
-        conn.commit()  # This commits the changes to the database to make sure they actually happen
-        conn.close()
-
     def edit_task(self):
+        if not self.details_loaded:
+            return
         inp_title = self.ids.title_input.text
         inp_date = self.ids.due_date_input.text
         inp_descr = self.ids.description_input.text
@@ -754,7 +875,6 @@ class EditTaskScreen(BaseScreen):
         inp_priority = self.get_priority()
         feedback_label = self.ids.feedback_label
 
-        print(inp_category)
         # all input values are stored as local variables
 
         valid, error_message = self.edit_task_validation(inp_title, inp_date, inp_descr, inp_category, inp_priority)
@@ -764,39 +884,52 @@ class EditTaskScreen(BaseScreen):
             return
         # Input values are validated, and if they are not valid, the relevant message is displayed
 
-        user_id = self.get_logged_in()
-        # user_id is found by checking which user is logged in
-        category_id = self.get_category_id(inp_category, user_id)
-        # category_id is found by using the inputted category's name and user_id
-
-        self.update_task(inp_title, inp_date, inp_descr, inp_priority, category_id, user_id)
-        # task is inserted into database
-
-        view_task_screen = self.manager.get_screen("view_task")
-        view_task_screen.task_title = inp_title
-        view_task_screen.task_due_date = inp_date
-        view_task_screen.task_description = inp_descr
-        view_task_screen.task_priority = self.convert_priority()
-        view_task_screen.task_category_id = str(category_id)
-        view_task_screen.task_id = self.task_id
-        # All of the view task screen's properties are changed to match the inputted properties
+        priority_text = self.convert_priority()
+        task_id = self.task_id
+        feedback_label.text = "Saving..."
+        feedback_label.color = (0, 0, 0, 1)
+
+        def save():  # runs on the database worker
+            return services.update_task(session.user_id, task_id, inp_title, inp_date, inp_descr, inp_category,
+                                        inp_priority)
+            # This uses task_id instead of title. The task repository only writes the columns that have changed,
+            # with the due date converted to the stored YYYY-MM-DD form, and returns the new category_id
+
+        def on_saved(category_id):
+            view_task_screen = self.manager.get_screen("view_task")
+            view_task_screen.task_title = inp_title
+            view_task_screen.task_due_date = inp_date
+            view_task_screen.task_description = inp_descr
+            view_task_screen.task_priority = priority_text
+            view_task_screen.task_category_id = str(category_id)
+            view_task_screen.task_id = moved_occurrence_id(self.task_id, dates.to_storage(inp_date))
+            # a repeating task's occurrence is identified by its due date, which may have just been moved
+            # All of the view task screen's properties are changed to match the inputted properties
+
+            self.manager.current = "view_task"
+            # Current screen is changed to View Task screen
+
+        def on_failed(error):
+            feedback_label.text = str(error)
+            feedback_label.color = (1, 0, 0, 1)
+            # the service rejected the task, for example because its category has just been deleted
 
-        self.manager.current = "view_task"
-        # Current screen is changed to View Task screen
+        worker.submit(save, on_saved, on_failed)
 
 
     def get_categories(self):
-        user_id = self.get_logged_in()
+        user_id = session.user_id
         # finds the logged in user
-        conn = sqlite3.connect("task_manager.db")
-        cur = conn.cursor()
-        cur.execute("SELECT category_name FROM Categories WHERE user_id = ?", (user_id,))
-        conn.commit()
-        user_categories = cur.fetchall()
-        # stores all categories in this user_categories variable
-        conn.close()
-        self.categories = [cat[0] for cat in user_categories]
-        # adds every category in user_categories to the categories list property
+        if category_cache.is_loaded(user_id):
+            self.categories = category_cache.names(user_id)
+            # the spinner is filled straight from the category cache once it has been loaded
+        else:
+            worker.submit(lambda: category_cache.names(user_id), self.on_categories_loaded)
+            # the first time, the cache loads every category in one query on the database worker
+
+    def on_categories_loaded(self, categories):
+        self.categories = categories
+        # adds every category that was fetched to the categories list property
 
 
 class CreateCategory(BaseScreen):
@@ -807,49 +940,40 @@ class CreateCategory(BaseScreen):
         f_label.text = ""
 
     def create_category(self, category_name):
-        user_id = self.get_logged_in()
-        # gets logged in user
-        feedback_label = self.ids.feedback_label
-        # makes sure the feedback label can be changed within this message by turning it into a variable
-        valid, message = self.category_validation(category_name)
-        # calls the category_validation() method to determine whether the category name is valid or not
+        worker.submit(lambda: self.save_category(category_name), self.on_category_saved, self.on_failed)
+        # the category is checked and added to the table on the database worker
+
+    def save_category(self, category_name):  # runs on the database worker
+        try:
+            services.create_category(session.user_id, category_name)
+            # checks the name and adds the category to the database and to the category cache, so the spinners
+            # and the menu show it without having to reload every category
+        except ServiceError as error:
+            return False, str(error)
+            # the name is not valid, or the unique (user_id, category_name) index rejected a second category with
+            # the same name
+        return True, None
+
+    def on_category_saved(self, result):
+        valid, message = result
         if valid:
-            self.add_cat_to_table(category_name, user_id)
             self.manager.current = "main"
             # if the category name is valid, the category is added to the table and the user is returned to the main
             # screen
         else:
+            feedback_label = self.ids.feedback_label
+            # makes sure the feedback label can be changed within this message by turning it into a variable
             feedback_label.text = message
             feedback_label.color = (1, 0, 0, 1)
             # if the category name is not valid, the relevant message is displayed
 
-    def get_logged_in(self):
-        conn = sqlite3.connect("task_manager.db")
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT user_id FROM Users WHERE logged_in = 1 LIMIT 1")  # Gets user_ID of a user that is logged in
-        result = cur.fetchone()
-        user_id = result[0]  # the actual integer is now returned
-        return user_id
-
-    def category_validation(self, category_name):
-        if not category_name.strip():
-            return False, "Category name cannot be empty"
-            # checks if name is present
-        elif len(category_name) > 20:
-            return False, "Category name must be less than 20 characters"
-            # checks if name is too long
-        else:
-            return True, None
-            # returns true if the category name is valid
+    def on_failed(self, error):
+        feedback_label = self.ids.feedback_label
+        feedback_label.text = f"Could not save the category: {error}"
+        feedback_label.color = (1, 0, 0, 1)
 
-    def add_cat_to_table(self, category_name, user_id):
-        conn = sqlite3.connect("task_manager.db")
-        cur = conn.cursor()
-        cur.execute("INSERT INTO Categories (category_name, user_id) VALUES (?, ?)", (category_name, user_id))
-        conn.commit()
-        conn.close()
-        # adds the category to the database
+
+startup_timer.mark("import")  # everything above this line is imported and defined
 
 
 class MyApp(App):  # defines the main application class which inherits from App
@@ -857,35 +981,94 @@ class MyApp(App):  # defines the main application class which inherits from App
 
     def build(self):
         sm_instance = sm(transition=NoTransition())  # creates an instance of the sm class
-        sm_instance.add_widget(MainScreen(name="main"))  # adds the MainScreen screen to the screen manager
-        sm_instance.add_widget(ChooseScreen(name="choosescreen"))  # adds the ChooseScreen screen to the screen manager
-        sm_instance.add_widget(LoginScreen(name="login"))  # adds the LoginScreen screen to the screen manager
-        sm_instance.add_widget(SignupScreen(name="signup"))  # adds the SignupScreen screen to the screen manager
-        sm_instance.add_widget(CreateTask(name="createtask"))  # adds the CreateScreen screen to the screen manager
-        sm_instance.add_widget(NavigationMenu(name="nav_menu"))  # Adds the menu to the screen manager
-        sm_instance.add_widget(TaskListScreen(name="task_list_screen"))
-        sm_instance.add_widget(ViewTask(name="view_task"))
-        sm_instance.add_widget(EditTaskScreen(name="edit_task"))
-        sm_instance.add_widget(CreateCategory(name="create_category"))
-
-        logged_in_user = self.get_logged_in_user()  # calls the method that finds a logged in user
-        if logged_in_user:
-            check_due_tasks(logged_in_user)
-            sm_instance.current = "main"  # opens MainScreen straight away
+        sm_instance.add_widget(LoadingScreen(name="loading"))  # the only screen created before the first frame
+        sm_instance.register("main", MainScreen)  # registers the MainScreen screen with the screen manager
+        sm_instance.register("choosescreen", ChooseScreen)  # registers the ChooseScreen screen with the screen manager
+        sm_instance.register("login", LoginScreen)  # registers the LoginScreen screen with the screen manager
+        sm_instance.register("signup", SignupScreen)  # registers the SignupScreen screen with the screen manager
+        sm_instance.register("createtask", CreateTask)  # registers the CreateScreen screen with the screen manager
+        sm_instance.register("nav_menu", NavigationMenu)  # registers the menu with the screen manager
+        sm_instance.register("task_list_screen", TaskListScreen)
+        sm_instance.register("view_task", ViewTask)
+        sm_instance.register("edit_task", EditTaskScreen)
+        sm_instance.register("create_category", CreateCategory)
+        # each screen is created the first time it is opened instead of all of them being built before the app
+        # is shown
+
+        def start():  # runs on the database worker
+            migrate()
+            # creates the tables and indexes, or brings an older database up to the latest version. This runs
+            # before any other job, and does nothing more than read user_version if it is up to date
+            return session.load()
+            # the session finds the logged in user once, so the app is shown without waiting. It is only loaded
+            # if the migrations worked, because it needs the Sessions table
+
+        worker.submit(start, lambda user: self.open_first_screen(sm_instance, user),
+                      lambda error: self.show_start_error(sm_instance, error))
+        startup_timer.mark("build")
+        return sm_instance
+
+    frame_spike_ms = 50  # frames that take longer than this are recorded as spikes
+
+    def on_start(self):
+        Clock.schedule_once(self.on_first_frame)
+        if profiler.enabled:
+            from kivy.core.window import Window  # imported here so the window is made after the Config.set() calls
+            Clock.schedule_interval(self.on_frame, 0)
+            Window.bind(on_key_down=self.on_key_down)
+        # when profiling is turned on every frame time is recorded, and F12 prints the slowest operations
 
+    def on_frame(self, dt):
+        profiler.record("frame", dt * 1000)
+        if dt * 1000 > self.frame_spike_ms:
+            profiler.record("frame spike", dt * 1000)
+
+    def on_key_down(self, window, key, scancode, codepoint, modifiers):
+        if key == 293:  # F12
+            profiler.dump()
+            return True
+
+    def on_first_frame(self, dt):
+        startup_timer.mark("first frame")
+        startup_timer.save()
+        # prints how long the import, build() and the first frame took and adds them to startup_times.jsonl
+
+    def open_first_screen(self, sm_instance, logged_in_user):
+        if logged_in_user:
+            sm_instance.current = "main"  # opens MainScreen
+            reminders.start(logged_in_user)
+            # due tasks are checked on the database worker after the main screen is shown, and then again every
+            # few minutes
         else:
-            sm_instance.current = "choosescreen"  # opens ChooseScreen straight away
-        return sm_instance
+            sm_instance.current = "choosescreen"  # opens ChooseScreen
 
-    def get_logged_in_user(self):
-        conn = sqlite3.connect("task_manager.db")
-        cur = conn.cursor()
-        cur.execute("SELECT user_id FROM Users WHERE logged_in = 1 LIMIT 1")  # selects a user who is logged in
-        result = cur.fetchone()
-        conn.close()
-        if result:
-            return result[0]  # Return username of logged in user
-        return None  # Returns nothing if there is no logged in user
+    def log_out(self):
+        worker.submit(session.log_out)
+        # Ends this device's session, other users' sessions are not touched. The worker runs jobs in order, so
+        # this always happens before anything a later login submits
+        reminders.stop()
+        category_cache.clear()
+        task_repository.clear()
+        recurrence_repository.clear()
+        # nothing the last user had loaded is kept for the next one
+        self.root.current = "choosescreen"  # Changes current screen to the ChooseScreen
+        # the Log out buttons on the main screen and the menu both call this
+
+    def show_start_error(self, sm_instance, error):
+        sm_instance.get_screen("loading").message = f"Could not open the database: {error}"
+        # stays on the loading screen with the reason, instead of "Loading..." for good
+
+    def on_stop(self):
+        if profiler.enabled:
+            for query in db.stats.report():
+                print(f"{query['count']:>6} x {query['avg_ms']:8.3f} ms avg {query['max_ms']:8.3f} ms max  "
+                      f"{query['sql']}")
+            # prints how many times each query ran and how long it took, slowest overall first
+            profiler.dump()
+            # and the p50/p95/max of the slowest screens, widget loops, queries and frames
+        reminders.stop()
+        worker.stop()
+        db.close()
 
 
 MyApp().run()  # starts the application
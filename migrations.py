@@ -0,0 +1,355 @@
+import sys
+from datetime import datetime
+
+from dates import DISPLAY_FORMAT
+from database import Database, db
+from queries import HOT_QUERIES
+
+# Each migration moves the schema on by one version. The current version is stored in the database file
+# itself with PRAGMA user_version, so a migration only ever runs once per database.
+
+
+class QueryPlanError(Exception):  # raised when a hot query would scan a whole table or sort in a temporary b-tree
+    pass
+
+
+def create_tables(database):
+    database.execute("""
+    CREATE TABLE IF NOT EXISTS Users (
+        user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL UNIQUE,
+        password_hash TEXT NOT NULL,
+        logged_in INTEGER DEFAULT 0
+        )
+    """)
+
+    database.execute("""
+    CREATE TABLE IF NOT EXISTS Categories (
+        category_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        category_name TEXT NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES Users (user_id)
+    )
+    """)
+
+    database.execute("""
+    CREATE TABLE IF NOT EXISTS Tasks (
+        task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        category_id INTEGER,
+        title TEXT NOT NULL,
+        description TEXT,
+        due_date TEXT,
+        priority INTEGER NOT NULL,
+        status TEXT DEFAULT 'pending',
+        FOREIGN KEY (user_id) REFERENCES Users (user_id),
+        FOREIGN KEY (category_id) REFERENCES Categories (category_id)
+    )
+    """)
+    # IF NOT EXISTS is kept so that databases created before migrations existed (user_version 0) are adopted
+
+
+def add_task_and_category_indexes(database):
+    database.execute("""
+    UPDATE Tasks SET category_id = (
+        SELECT MIN(keep.category_id) FROM Categories AS keep
+        JOIN Categories AS dup ON dup.user_id = keep.user_id AND dup.category_name = keep.category_name
+        WHERE dup.category_id = Tasks.category_id
+    )
+    WHERE category_id IS NOT NULL
+    """)
+    database.execute("""
+    DELETE FROM Categories WHERE category_id NOT IN (
+        SELECT MIN(category_id) FROM Categories GROUP BY user_id, category_name
+    )
+    """)
+    # older databases could contain the same category name twice for one user, so tasks are moved onto the
+    # oldest copy and the duplicates are removed before the unique index is created
+
+    database.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_categories_user_name "
+                     "ON Categories (user_id, category_name)")
+
+    database.execute("CREATE INDEX IF NOT EXISTS idx_tasks_user_status_priority "
+                     "ON Tasks (user_id, status, priority, task_id, title, due_date, category_id)")
+    # serves the "all" and "completed" filters
+    database.execute("CREATE INDEX IF NOT EXISTS idx_tasks_user_status_due "
+                     "ON Tasks (user_id, status, due_date, priority, task_id, title, category_id)")
+    # serves the "today" filter and the due task reminders
+    database.execute("CREATE INDEX IF NOT EXISTS idx_tasks_user_status_category "
+                     "ON Tasks (user_id, status, category_id, priority, task_id, title, due_date)")
+    # serves the "category" filter
+    # every task list index ends with all of the list's columns so rows never have to be looked up in Tasks,
+    # and task_id comes straight after priority so tasks with the same priority stay in a stable order
+
+
+def rewrite_due_dates(database, batch_size=500):
+    last_id = 0
+    while True:
+        rows = database.fetchall("""
+        SELECT task_id, due_date FROM Tasks
+        WHERE task_id > ? AND due_date NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'
+        ORDER BY task_id LIMIT ?
+        """, (last_id, batch_size))
+        if not rows:
+            break
+        updates = []
+        for task_id, due_date in rows:
+            try:
+                updates.append((datetime.strptime(due_date, DISPLAY_FORMAT).date().isoformat(), task_id))
+            except (TypeError, ValueError):
+                pass
+                # a due date that the old check would never have accepted is left as it is
+        database.executemany("UPDATE Tasks SET due_date = ? WHERE task_id = ?", updates)
+        last_id = rows[-1][0]
+        database.commit()
+        database.execute("BEGIN")
+    # rewrites DD-MM-YYYY due dates as YYYY-MM-DD a batch at a time, committing after each batch so that other
+    # connections are never locked out for long. Each date is parsed with the same strptime format that the old
+    # check used, so dates it accepted without leading zeros (1-1-2025) are converted too. Converted rows are
+    # ISO dates and no longer selected, so an interrupted run simply carries on the next time the app starts
+
+
+def convert_due_dates_to_iso(database, batch_size=500):
+    rewrite_due_dates(database, batch_size)
+
+    database.execute("DROP INDEX IF EXISTS idx_tasks_user_status_due")
+    database.execute("CREATE INDEX IF NOT EXISTS idx_tasks_user_status_due_date "
+                     "ON Tasks (user_id, status, due_date, priority DESC, task_id DESC, title, category_id)")
+    # priority and task_id are stored descending so the date range filters can be read in
+    # (due_date, priority DESC, task_id DESC) order without a sort
+
+
+def add_sent_reminders(database):
+    database.execute("""
+    CREATE TABLE IF NOT EXISTS SentReminders (
+        task_id INTEGER NOT NULL,
+        bucket TEXT NOT NULL,
+        sent_on TEXT NOT NULL,
+        PRIMARY KEY (task_id, bucket, sent_on)
+    ) WITHOUT ROWID
+    """)
+    # records which reminders have been sent each day, so a restart or the next check does not send them again
+
+
+def add_task_search(database):
+    database.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS TaskSearch USING fts5(
+        title, description, content='Tasks', content_rowid='task_id', prefix='1 2 3'
+    )
+    """)
+    # an external content FTS5 index over Tasks, so the text is not stored twice. prefix='1 2 3' keeps extra
+    # indexes for the first 1-3 letters of every word, so as-you-type prefix searches do not scan the whole index
+    database.execute("""
+    CREATE TRIGGER IF NOT EXISTS tasks_search_insert AFTER INSERT ON Tasks BEGIN
+        INSERT INTO TaskSearch (rowid, title, description) VALUES (new.task_id, new.title, new.description);
+    END
+    """)
+    database.execute("""
+    CREATE TRIGGER IF NOT EXISTS tasks_search_delete AFTER DELETE ON Tasks BEGIN
+        INSERT INTO TaskSearch (TaskSearch, rowid, title, description)
+        VALUES ('delete', old.task_id, old.title, old.description);
+    END
+    """)
+    database.execute("""
+    CREATE TRIGGER IF NOT EXISTS tasks_search_update AFTER UPDATE OF title, description ON Tasks BEGIN
+        INSERT INTO TaskSearch (TaskSearch, rowid, title, description)
+        VALUES ('delete', old.task_id, old.title, old.description);
+        INSERT INTO TaskSearch (rowid, title, description) VALUES (new.task_id, new.title, new.description);
+    END
+    """)
+    # the triggers keep the index in step with every insert, delete and title or description change, whichever
+    # code path makes it
+    database.execute("INSERT INTO TaskSearch (TaskSearch) VALUES ('rebuild')")
+    # indexes the tasks that already exist
+
+
+def add_sessions(database):
+    database.execute("""
+    CREATE TABLE IF NOT EXISTS Sessions (
+        token_hash TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        created TEXT NOT NULL,
+        expires TEXT NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES Users (user_id)
+    ) WITHOUT ROWID
+    """)
+    # one row for every logged in device or client, looked up by the SHA-256 of its token so the tokens
+    # themselves are never stored. This replaces the Users.logged_in flag, which is no longer read or written
+    database.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires ON Sessions (expires)")
+    database.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user ON Sessions (user_id)")
+    # expired sessions are removed with a range scan, and all of one user's sessions can be found without a scan
+
+
+def add_task_stats(database):
+    database.execute("""
+    CREATE TABLE IF NOT EXISTS TaskStats (
+        user_id INTEGER NOT NULL,
+        category_id INTEGER NOT NULL,
+        pending INTEGER NOT NULL DEFAULT 0,
+        completed INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, category_id)
+    ) WITHOUT ROWID
+    """)
+    # how many pending and completed tasks each user has in each category (0 for tasks without a category)
+    database.execute("""
+    CREATE TABLE IF NOT EXISTS TaskDueCounts (
+        user_id INTEGER NOT NULL,
+        due_date TEXT NOT NULL,
+        pending INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, due_date)
+    ) WITHOUT ROWID
+    """)
+    # how many pending tasks each user has due on each date. Whether a date is today or overdue changes every day,
+    # so the counts are kept per date and "due today" and "overdue" are read from them with the date at the time
+    database.execute("""
+    CREATE TRIGGER IF NOT EXISTS tasks_stats_insert AFTER INSERT ON Tasks BEGIN
+        INSERT INTO TaskStats (user_id, category_id, pending, completed)
+        VALUES (new.user_id, ifnull(new.category_id, 0), new.status = 'pending', new.status = 'completed')
+        ON CONFLICT (user_id, category_id) DO UPDATE
+        SET pending = pending + excluded.pending, completed = completed + excluded.completed;
+        INSERT INTO TaskDueCounts (user_id, due_date, pending)
+        SELECT new.user_id, new.due_date, 1 WHERE new.status = 'pending' AND new.due_date IS NOT NULL
+        ON CONFLICT (user_id, due_date) DO UPDATE SET pending = pending + 1;
+    END
+    """)
+    database.execute("""
+    CREATE TRIGGER IF NOT EXISTS tasks_stats_delete AFTER DELETE ON Tasks BEGIN
+        UPDATE TaskStats
+        SET pending = pending - (old.status = 'pending'), completed = completed - (old.status = 'completed')
+        WHERE user_id = old.user_id AND category_id = ifnull(old.category_id, 0);
+        UPDATE TaskDueCounts SET pending = pending - 1
+        WHERE old.status = 'pending' AND user_id = old.user_id AND due_date = old.due_date;
+        DELETE FROM TaskDueCounts WHERE user_id = old.user_id AND due_date = old.due_date AND pending = 0;
+    END
+    """)
+    database.execute("""
+    CREATE TRIGGER IF NOT EXISTS tasks_stats_update AFTER UPDATE OF user_id, category_id, status, due_date ON Tasks
+    BEGIN
+        UPDATE TaskStats
+        SET pending = pending - (old.status = 'pending'), completed = completed - (old.status = 'completed')
+        WHERE user_id = old.user_id AND category_id = ifnull(old.category_id, 0);
+        UPDATE TaskDueCounts SET pending = pending - 1
+        WHERE old.status = 'pending' AND user_id = old.user_id AND due_date = old.due_date;
+        DELETE FROM TaskDueCounts WHERE user_id = old.user_id AND due_date = old.due_date AND pending = 0;
+        INSERT INTO TaskStats (user_id, category_id, pending, completed)
+        VALUES (new.user_id, ifnull(new.category_id, 0), new.status = 'pending', new.status = 'completed')
+        ON CONFLICT (user_id, category_id) DO UPDATE
+        SET pending = pending + excluded.pending, completed = completed + excluded.completed;
+        INSERT INTO TaskDueCounts (user_id, due_date, pending)
+        SELECT new.user_id, new.due_date, 1 WHERE new.status = 'pending' AND new.due_date IS NOT NULL
+        ON CONFLICT (user_id, due_date) DO UPDATE SET pending = pending + 1;
+    END
+    """)
+    # the triggers take the old row out of the counts and add the new one, so every insert, delete, completion,
+    # move and due date change keeps them right, whichever code path makes it. Dates with no pending tasks left
+    # are removed so the overdue range only ever covers dates that still have overdue tasks
+    database.execute("""
+    INSERT INTO TaskStats (user_id, category_id, pending, completed)
+    SELECT user_id, ifnull(category_id, 0), sum(status = 'pending'), sum(status = 'completed')
+    FROM Tasks GROUP BY user_id, ifnull(category_id, 0)
+    """)
+    database.execute("""
+    INSERT INTO TaskDueCounts (user_id, due_date, pending)
+    SELECT user_id, due_date, COUNT(*) FROM Tasks
+    WHERE status = 'pending' AND due_date IS NOT NULL GROUP BY user_id, due_date
+    """)
+    # counts the tasks that already exist, once
+
+
+def add_recurrences(database):
+    database.execute("""
+    CREATE TABLE IF NOT EXISTS Recurrences (
+        recurrence_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        category_id INTEGER,
+        title TEXT NOT NULL,
+        description TEXT,
+        priority INTEGER NOT NULL,
+        start_date TEXT NOT NULL,
+        repeat_unit TEXT NOT NULL,
+        repeat_every INTEGER NOT NULL DEFAULT 1,
+        end_date TEXT,
+        FOREIGN KEY (user_id) REFERENCES Users (user_id),
+        FOREIGN KEY (category_id) REFERENCES Categories (category_id)
+    )
+    """)
+    # one row for each repeating task, due every repeat_every days, weeks or months (repeat_unit) from start_date
+    # until end_date, or for ever if end_date is NULL. The dates it falls due on are never stored
+    database.execute("CREATE INDEX IF NOT EXISTS idx_recurrences_user ON Recurrences (user_id)")
+    database.execute("""
+    CREATE TABLE IF NOT EXISTS RecurrenceCompletions (
+        recurrence_id INTEGER NOT NULL,
+        due_date TEXT NOT NULL,
+        PRIMARY KEY (recurrence_id, due_date),
+        FOREIGN KEY (recurrence_id) REFERENCES Recurrences (recurrence_id)
+    ) WITHOUT ROWID
+    """)
+    # the occurrences that have been completed, one row each, found through the primary key for each series
+
+
+def fix_unpadded_due_dates(database):
+    rewrite_due_dates(database)
+    # version 3 only converted zero-padded dates, this converts the ones it left behind (such as 1-1-2025) in
+    # databases that were already past version 3
+
+
+MIGRATIONS = [
+    create_tables,  # version 1
+    add_task_and_category_indexes,  # version 2
+    convert_due_dates_to_iso,  # version 3
+    add_sent_reminders,  # version 4
+    add_task_search,  # version 5
+    add_sessions,  # version 6
+    add_task_stats,  # version 7
+    add_recurrences,  # version 8
+    fix_unpadded_due_dates,  # version 9
+]
+
+LATEST_VERSION = len(MIGRATIONS)
+
+
+def get_version(database):
+    return database.fetchvalue("PRAGMA user_version")
+
+
+def migrate(database=db):
+    version = get_version(database)
+    if version >= LATEST_VERSION:
+        return version
+    # an up to date database only costs reading user_version, none of the schema statements are run
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        database.execute("BEGIN")
+        try:
+            migration(database)
+            database.execute(f"PRAGMA user_version = {number}")
+            # user_version is part of the database header, so it is rolled back with the migration if it fails
+            database.commit()
+        except Exception:
+            database.rollback()
+            raise
+    return get_version(database)
+    # runs every migration newer than the database's current version, each in its own transaction
+
+
+def explain(database, sql, params):
+    return [row[3] for row in database.fetchall("EXPLAIN QUERY PLAN " + sql, params)]
+    # the fourth column of each EXPLAIN QUERY PLAN row holds the readable description of that step
+
+
+def check_query_plans(database=db):
+    problems = []
+    for name, (sql, params) in HOT_QUERIES.items():
+        for step in explain(database, sql, params):
+            if step.startswith("SCAN") or "TEMP B-TREE" in step:
+                problems.append(f"{name}: {step}")
+    if problems:
+        raise QueryPlanError("Hot queries are not using an index:\n" + "\n".join(problems))
+    # raises QueryPlanError if any hot query reads a whole table or has to sort its results
+
+
+if __name__ == "__main__":
+    target = Database(sys.argv[1]) if len(sys.argv) > 1 else db
+    print(f"Migrated to version {migrate(target)}")
+    check_query_plans(target)
+    print("All hot queries use an index")
+    # python migrations.py [path] migrates a database and then checks the hot query plans
@@ -0,0 +1,143 @@
+import hashlib
+import hmac
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+# Passwords are stored as "algorithm$parameters$salt$hash", so the algorithm and its cost can be changed later and
+# every stored hash still says how it was made. Hashes from before this (a bare SHA-256 hex digest) are still
+# accepted, and are replaced with a new hash the next time that user logs in.
+
+SALT_BYTES = 16
+SCRYPT_N = 2 ** 14  # the scrypt cost, each doubling doubles both the time and the memory a hash takes
+SCRYPT_R = 8
+SCRYPT_P = 1
+PBKDF2_ITERATIONS = 600000  # only used where hashlib was built without scrypt
+CACHE_SIZE = 32  # how many recent successful logins are remembered (see verify_password)
+
+
+class ScryptHasher:
+    algorithm = "scrypt"
+
+    def __init__(self, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+        self.n, self.r, self.p = n, r, p
+
+    def derive(self, password, salt, n, r, p):
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r * p + 1024 * 1024)
+        # scrypt needs 128 * n * r bytes, maxmem is raised so larger costs are not refused
+
+    def hash(self, password):
+        salt = os.urandom(SALT_BYTES)
+        key = self.derive(password, salt, self.n, self.r, self.p)
+        return f"{self.algorithm}${self.n}${self.r}${self.p}${salt.hex()}${key.hex()}"
+
+    def verify(self, password, encoded):
+        n, r, p, salt, key = encoded.split("$")[1:]
+        derived = self.derive(password, bytes.fromhex(salt), int(n), int(r), int(p))
+        return hmac.compare_digest(derived, bytes.fromhex(key))
+
+    def needs_rehash(self, encoded):
+        return encoded.split("$")[1:4] != [str(self.n), str(self.r), str(self.p)]
+
+
+class PBKDF2Hasher:
+    algorithm = "pbkdf2_sha256"
+
+    def __init__(self, iterations=PBKDF2_ITERATIONS):
+        self.iterations = iterations
+
+    def hash(self, password):
+        salt = os.urandom(SALT_BYTES)
+        key = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, self.iterations)
+        return f"{self.algorithm}${self.iterations}${salt.hex()}${key.hex()}"
+
+    def verify(self, password, encoded):
+        iterations, salt, key = encoded.split("$")[1:]
+        derived = hashlib.pbkdf2_hmac("sha256", password.encode(), bytes.fromhex(salt), int(iterations))
+        return hmac.compare_digest(derived, bytes.fromhex(key))
+
+    def needs_rehash(self, encoded):
+        return encoded.split("$")[1] != str(self.iterations)
+
+
+class LegacySHA256Hasher:  # the unsalted hashes that every account was created with before
+    algorithm = "sha256"
+
+    def verify(self, password, encoded):
+        return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), encoded)
+
+
+HASHERS = {hasher.algorithm: hasher for hasher in (ScryptHasher(), PBKDF2Hasher(), LegacySHA256Hasher())}
+hasher = HASHERS["scrypt"] if hasattr(hashlib, "scrypt") else HASHERS["pbkdf2_sha256"]
+# the hasher that new passwords are hashed with
+
+
+def hasher_for(encoded):
+    algorithm = encoded.split("$", 1)[0] if "$" in encoded else "sha256"
+    return HASHERS.get(algorithm)
+
+
+class VerificationCache:  # remembers recent successful logins so logging out and back in does not repeat the KDF
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.key = os.urandom(32)  # a new key every time the app starts, it is never stored
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # stored hash -> keyed digest of the password that matched it
+
+    def digest(self, password):
+        return hmac.new(self.key, password.encode(), hashlib.sha256).digest()
+        # a fast keyed hash, the password itself is never kept in memory
+
+    def check(self, password, encoded):
+        with self.lock:
+            digest = self.entries.get(encoded)
+        return digest is not None and hmac.compare_digest(digest, self.digest(password))
+
+    def add(self, password, encoded):
+        with self.lock:
+            self.entries[encoded] = self.digest(password)
+            self.entries.move_to_end(encoded)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+verification_cache = VerificationCache()
+
+
+def hash_password(password):
+    return hasher.hash(password)
+    # slow on purpose, so it should only be called on the database worker
+
+
+def verify_password(password, encoded, cache=True):
+    if cache and verification_cache.check(password, encoded):
+        return True, False
+    found = hasher_for(encoded)
+    if found is None or not found.verify(password, encoded):
+        return False, False
+    if cache:
+        verification_cache.add(password, encoded)
+    return True, found is not hasher or hasher.needs_rehash(encoded)
+    # returns (matches, needs_rehash). needs_rehash is True for old SHA-256 hashes and for hashes made with a
+    # different algorithm or cost, so the caller can store a new hash while it still has the password
+
+
+def calibrate(target_ms=250, password="Calibrate1!"):
+    n = 2 ** 10
+    while True:
+        start = time.perf_counter()
+        ScryptHasher(n=n).hash(password)
+        elapsed = (time.perf_counter() - start) * 1000
+        if elapsed >= target_ms or n >= 2 ** 20:
+            return n, elapsed
+        n *= 2
+    # finds the smallest power of two scrypt cost that takes at least target_ms on this device
+
+
+if __name__ == "__main__":
+    target = float(sys.argv[1]) if len(sys.argv) > 1 else 250
+    n, elapsed = calibrate(target)
+    print(f"SCRYPT_N = 2 ** {n.bit_length() - 1}  # {elapsed:.0f} ms per hash on this device (target {target:.0f} ms)")
+    # python passwords.py [target_ms] suggests the SCRYPT_N to use for the device it is run on
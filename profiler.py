@@ -0,0 +1,73 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+SAMPLES = 500  # how many recent timings are kept for each operation
+
+
+class Profiler:  # keeps the most recent timings of each named operation in a ring buffer
+    def __init__(self, enabled=False, samples=SAMPLES):
+        self.enabled = enabled
+        self.samples = samples
+        self.lock = threading.Lock()  # timings come from the main thread and the database worker
+        self.timings = {}  # name -> deque of the last few milliseconds
+        self.counts = {}  # name -> how many times it has run in total
+
+    def record(self, name, elapsed_ms):
+        with self.lock:
+            timings = self.timings.get(name)
+            if timings is None:
+                timings = self.timings[name] = deque(maxlen=self.samples)
+                self.counts[name] = 0
+            timings.append(elapsed_ms)
+            self.counts[name] += 1
+        # once the deque is full the oldest timing is dropped, so memory use never grows
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000)
+
+    def measure(self, name):
+        return self.timer(name) if self.enabled else nullcontext()
+        # with profiler.measure("name"): times the block, and costs a single check when profiling is off
+
+    def report(self):
+        with self.lock:
+            items = [(name, list(timings), self.counts[name]) for name, timings in self.timings.items()]
+        rows = []
+        for name, timings, count in items:
+            timings.sort()
+            rows.append({
+                "name": name,
+                "count": count,
+                "p50_ms": timings[len(timings) // 2],
+                "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+                "max_ms": timings[-1],
+            })
+        rows.sort(key=lambda row: row["p95_ms"], reverse=True)
+        return rows
+        # the percentiles are worked out from the recent timings, the slowest operations are listed first
+
+    def dump(self, limit=30):
+        lines = [f"{'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'count':>7}  operation"]
+        for row in self.report()[:limit]:
+            name = " ".join(row["name"].split())  # multi-line SQL is printed on one line
+            lines.append(f"{row['p50_ms']:9.2f} {row['p95_ms']:9.2f} {row['max_ms']:9.2f} {row['count']:7}  {name}")
+        text = "\n".join(lines)
+        print(text)
+        return text
+
+    def reset(self):
+        with self.lock:
+            self.timings.clear()
+            self.counts.clear()
+
+
+profiler = Profiler(enabled=os.environ.get("TASKSPHERE_PROFILE") == "1")
+# profiling is turned on by starting the app with TASKSPHERE_PROFILE=1
@@ -0,0 +1,148 @@
+# SQL that runs on the app's hot paths. Keeping it in one place means the screens and the
+# EXPLAIN QUERY PLAN check in migrations.py always look at exactly the same statements.
+
+TASK_LIST_COLUMNS = "task_id, title, due_date, priority, status, category_id"
+# the task list only shows these columns, so every filter below can be answered from an index alone
+MAX_TASK_ID = 2 ** 63 - 1  # the largest rowid SQLite can give a task
+
+
+class TaskListQuery:  # the SQL for one TaskListScreen filter, split into pages with keyset pagination
+    def __init__(self, where, by_due_date=False):
+        self.by_due_date = by_due_date
+        if by_due_date:
+            order = "due_date, priority DESC, task_id DESC"
+            after = "due_date >= ? AND (due_date > ? OR (priority, task_id) < (?, ?))"
+        else:
+            order = "priority DESC, task_id DESC"
+            after = "(priority, task_id) < (?, ?)"
+        self.first_page = f"SELECT {TASK_LIST_COLUMNS} FROM Tasks WHERE {where} ORDER BY {order} LIMIT ?"
+        self.next_page = f"SELECT {TASK_LIST_COLUMNS} FROM Tasks WHERE {where} AND {after} ORDER BY {order} LIMIT ?"
+        # the next page starts straight after the last row that was shown, rather than using OFFSET, so SQLite seeks
+        # to it in the index instead of reading and throwing away every earlier row
+
+    def after(self, last_row):
+        task_id, title, due_date, priority = last_row[:4]
+        if not isinstance(task_id, int):
+            task_id = MAX_TASK_ID
+        # an occurrence of a repeating task comes before the tasks with the same due date and priority, so all of
+        # those tasks are still to come
+        if self.by_due_date:
+            return due_date, due_date, priority, task_id
+        return priority, task_id
+        # the parameters for next_page that continue on from last_row
+
+
+ALL_TASKS = TaskListQuery("user_id = ? AND status = 'pending'")
+
+TODAY_TASKS = TaskListQuery("due_date = ? AND user_id = ? AND status = 'pending'")
+
+OVERDUE_TASKS = TaskListQuery("user_id = ? AND status = 'pending' AND due_date < ?", by_due_date=True)
+
+WEEK_TASKS = TaskListQuery("user_id = ? AND status = 'pending' AND due_date BETWEEN ? AND ?", by_due_date=True)
+# due dates are stored as YYYY-MM-DD, so these date ranges are read in order straight from the due date index
+
+COMPLETED_TASKS = TaskListQuery("status = ? AND user_id = ?")
+
+CATEGORY_TASKS = TaskListQuery("category_id = ? AND user_id = ? AND status = 'pending'")
+
+INSERT_TASK = ("INSERT INTO Tasks (user_id, category_id, title, description, due_date, priority, status) "
+               "VALUES (?, ?, ?, ?, ?, ?, 'pending')")
+
+INSERT_TASK_WITH_STATUS = ("INSERT INTO Tasks (user_id, category_id, title, description, due_date, priority, status) "
+                           "VALUES (?, ?, ?, ?, ?, ?, ?)")
+
+USER_TASKS = f"SELECT {TASK_LIST_COLUMNS} FROM Tasks WHERE user_id = ?"
+# loads every task for a user into the TaskRepository
+
+DUE_TASKS = ("SELECT task_id, title, due_date FROM Tasks "
+             "WHERE user_id = ? AND status = 'pending' AND due_date <= ?")
+# every pending task that is overdue or due in the next few days, for the reminder scheduler
+
+SENT_REMINDERS = "SELECT task_id, bucket FROM SentReminders WHERE sent_on = ?"
+
+SEARCH_TITLE_WEIGHT = 4.0  # a word in the title counts four times as much as the same word in the description
+SEARCH_PRIORITY_WEIGHT = 0.25  # each priority level makes a match rank 25% higher
+
+SEARCH_TASKS = (f"SELECT Tasks.task_id, Tasks.title, Tasks.due_date, Tasks.priority, Tasks.status, Tasks.category_id "
+                f"FROM TaskSearch JOIN Tasks ON Tasks.task_id = TaskSearch.rowid "
+                f"WHERE TaskSearch MATCH ? AND Tasks.user_id = ? "
+                f"ORDER BY bm25(TaskSearch, {SEARCH_TITLE_WEIGHT}, 1.0) "
+                f"* (1 + {SEARCH_PRIORITY_WEIGHT} * Tasks.priority), "
+                f"Tasks.task_id DESC LIMIT ?")
+# bm25() is negative and lower is a better match, so multiplying it by a larger number for higher priorities moves
+# important tasks up without letting a poor match outrank a good one. This is not in HOT_QUERIES because ranking
+# always needs a sort, it is kept quick by the FTS index only returning matching rows.
+
+
+def search_words(text):
+    return "".join(c if c.isalnum() else " " for c in text).split()
+
+
+def search_match(text):
+    return " ".join(f'"{word}"*' for word in search_words(text))
+    # turns what the user has typed into an FTS5 query where every word is a prefix, so "shop li" finds
+    # "Shopping list". Punctuation is removed so it can never be read as FTS5 syntax.
+
+
+TASK_DESCRIPTION = "SELECT description FROM Tasks WHERE task_id = ? AND user_id = ?"
+
+USER_CATEGORIES = "SELECT category_id, category_name FROM Categories WHERE user_id = ?"
+
+LOGIN = "SELECT user_id, password_hash FROM Users WHERE username = ?"
+
+SESSION_USER = "SELECT user_id FROM Sessions WHERE token_hash = ? AND expires > ?"
+
+RECURRENCE_COLUMNS = "recurrence_id, title, priority, category_id, start_date, repeat_unit, repeat_every, end_date"
+
+USER_RECURRENCES = f"SELECT {RECURRENCE_COLUMNS} FROM Recurrences WHERE user_id = ?"
+# loads every repeating task for a user into the RecurrenceRepository
+
+RECURRENCE = f"SELECT {RECURRENCE_COLUMNS} FROM Recurrences WHERE recurrence_id = ? AND user_id = ?"
+
+USER_COMPLETIONS = ("SELECT RecurrenceCompletions.recurrence_id, due_date FROM Recurrences "
+                    "JOIN RecurrenceCompletions ON RecurrenceCompletions.recurrence_id = Recurrences.recurrence_id "
+                    "WHERE user_id = ?")
+
+INSERT_RECURRENCE = ("INSERT INTO Recurrences (user_id, category_id, title, description, priority, start_date, "
+                     "repeat_unit, repeat_every) VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+
+INSERT_COMPLETION = "INSERT OR IGNORE INTO RecurrenceCompletions (recurrence_id, due_date) VALUES (?, ?)"
+
+SEARCH_RECURRENCES = "SELECT recurrence_id, title, description FROM Recurrences WHERE user_id = ?"
+
+EXPORT_RECURRENCES = ("SELECT recurrence_id, title, description, start_date, category_id, priority, repeat_unit, "
+                      "repeat_every FROM Recurrences WHERE user_id = ? ORDER BY recurrence_id")
+
+TASK_STATS = "SELECT category_id, pending, completed FROM TaskStats WHERE user_id = ?"
+# one row for each of the user's categories, kept up to date by triggers on Tasks (see migrations.add_task_stats)
+
+DUE_COUNTS = ("SELECT total(pending) FILTER (WHERE due_date < ?), total(pending) FILTER (WHERE due_date = ?) "
+              "FROM TaskDueCounts WHERE user_id = ? AND due_date <= ?")
+# the pending tasks that are overdue and due today, added up over one row per date rather than one per task
+
+TASK_LIST_EXAMPLES = {  # each task list query with example parameters for its filter
+    "all": (ALL_TASKS, (1,)),
+    "today": (TODAY_TASKS, ("2025-01-01", 1)),
+    "overdue": (OVERDUE_TASKS, (1, "2025-01-01")),
+    "next 7 days": (WEEK_TASKS, (1, "2025-01-01", "2025-01-08")),
+    "completed": (COMPLETED_TASKS, ("completed", 1)),
+    "category": (CATEGORY_TASKS, (1, 1)),
+}
+
+HOT_QUERIES = {
+    "due task reminders": (DUE_TASKS, (1, "2025-01-04")),
+    "user categories": (USER_CATEGORIES, (1,)),
+    "user tasks": (USER_TASKS, (1,)),
+    "login": (LOGIN, ("user",)),
+    "session user": (SESSION_USER, ("0" * 64, "2025-01-01 00:00:00")),
+    "task stats": (TASK_STATS, (1,)),
+    "user recurrences": (USER_RECURRENCES, (1,)),
+    "recurrence completions": (USER_COMPLETIONS, (1,)),
+    "recurrence search": (SEARCH_RECURRENCES, (1,)),
+    "due counts": (DUE_COUNTS, ("2025-01-01", "2025-01-01", 1, "2025-01-01")),
+}
+EXAMPLE_LAST_ROW = (1, "title", "2025-01-01", 2, "pending", 1)
+for name, (query, params) in TASK_LIST_EXAMPLES.items():
+    HOT_QUERIES[f"task list ({name})"] = (query.first_page, params + (50,))
+    HOT_QUERIES[f"task list ({name}, next page)"] = (query.next_page, params + query.after(EXAMPLE_LAST_ROW) + (50,))
+# every query here is checked by migrations.check_query_plans(), along with example parameters to bind
@@ -0,0 +1,363 @@
+import calendar
+import heapq
+import json
+import threading
+from datetime import date, timedelta
+
+from database import db
+import queries
+
+# A repeating task is stored once, as a rule in the Recurrences table, instead of one Tasks row for every time it
+# is due. Its occurrences are worked out only for the dates that are being looked at (a task list filter or the
+# reminder check), and the only thing stored for an occurrence is that it has been completed.
+
+UNITS = {"Daily": "day", "Weekly": "week", "Monthly": "month"}  # the Repeat spinner's choices -> repeat_unit
+MAX_EVERY = 365  # the longest gap that can be typed in, "every 365 days" or "every 365 months"
+
+
+def occurrence_id(recurrence_id, due_date):
+    return f"r{recurrence_id}:{due_date}"
+    # an occurrence has no row of its own, so it is identified by its series and due date. The "r" keeps it apart
+    # from a task_id everywhere a task_id is passed around (the task list, selection, ViewTask)
+
+
+def parse_occurrence_id(task_id):
+    if isinstance(task_id, str) and task_id.startswith("r"):
+        recurrence_id, _, due_date = task_id[1:].partition(":")
+        return int(recurrence_id), due_date
+    return None
+    # returns (recurrence_id, due_date) for an occurrence, or None for an ordinary task_id
+
+
+def moved_occurrence_id(task_id, due_date):
+    occurrence = parse_occurrence_id(task_id)
+    return task_id if occurrence is None else occurrence_id(occurrence[0], due_date)
+    # the id an occurrence has once its series has been moved to a new due date, task_ids stay the same
+
+
+def row_order(row, by_due_date=False):
+    task_id, title, due_date, priority = row[:4]
+    occurrence = parse_occurrence_id(task_id)
+    last = (0, -occurrence[0]) if occurrence else (1, -task_id)
+    return (due_date or "", -priority) + last if by_due_date else (-priority,) + last
+    # the same order as the task list queries, with occurrences before tasks of the same priority
+
+
+def merge_rows(tasks, occurrences, by_due_date=False):
+    key = lambda row: row_order(row, by_due_date)
+    return list(heapq.merge(tasks, sorted(occurrences, key=key), key=key))
+    # tasks are already in order, so the occurrences are merged in without sorting every task again
+
+
+def add_months(day, months, day_of_month):
+    month = day.month - 1 + months
+    year = day.year + month // 12
+    month = month % 12 + 1
+    return date(year, month, min(day_of_month, calendar.monthrange(year, month)[1]))
+    # a series that starts on the 31st is due on the last day of shorter months, and back on the 31st after them
+
+
+class Series:  # one repeating task, __slots__ keeps each record small in the same way as tasks.Task
+    __slots__ = ("recurrence_id", "title", "priority", "category_id", "start", "unit", "every", "end")
+
+    def __init__(self, recurrence_id, title, priority, category_id, start_date, unit, every, end_date):
+        self.recurrence_id = recurrence_id
+        self.title = title
+        self.priority = priority
+        self.category_id = category_id
+        self.start = date.fromisoformat(start_date)
+        self.unit = unit
+        self.every = every
+        self.end = date.fromisoformat(end_date) if end_date else None
+
+    def nth(self, n):
+        if self.unit == "month":
+            return add_months(self.start, n * self.every, self.start.day)
+        return self.start + timedelta(days=n * self.every * (7 if self.unit == "week" else 1))
+        # the date of occurrence n, worked out straight from the start date rather than stepping through the
+        # ones before it
+
+    def index_from(self, day):
+        if day <= self.start:
+            return 0
+        if self.unit == "month":
+            n = -(-((day.year - self.start.year) * 12 + day.month - self.start.month) // self.every)
+            while n > 0 and self.nth(n - 1) >= day:
+                n -= 1
+            while self.nth(n) < day:
+                n += 1
+            return n
+        step = self.every * (7 if self.unit == "week" else 1)
+        return -(-(day - self.start).days // step)
+        # the number of the first occurrence on or after day, found with arithmetic so a series that started years
+        # ago costs the same as a new one
+
+    def is_due(self, day):
+        return (self.end is None or day <= self.end) and day >= self.start and self.nth(self.index_from(day)) == day
+
+    def between(self, first, last):
+        n = self.index_from(first)
+        while True:
+            day = self.nth(n)
+            if day > last or (self.end is not None and day > self.end):
+                return
+            yield day
+            n += 1
+        # every occurrence from first to last, inclusive
+
+    def last_before(self, day):
+        n = self.index_from(day) - 1
+        if n < 0:
+            return None
+        last = self.nth(n)
+        return last if self.end is None or last <= self.end else None
+
+    def row(self, day, status="pending"):
+        due_date = day.isoformat()
+        return (occurrence_id(self.recurrence_id, due_date), self.title, due_date, self.priority, status,
+                self.category_id)
+        # the same shape as a task list row, so occurrences can be shown and sorted alongside tasks
+
+
+class RecurrenceRepository:  # the logged in user's repeating tasks, kept in memory like the TaskRepository
+    def __init__(self, database=db):
+        self.database = database
+        self.lock = threading.Lock()  # series are written on the database worker and read on the main thread
+        self.user_id = None  # the user whose series are loaded, None if nothing is loaded
+        self.series = {}  # recurrence_id -> Series
+        self.completed = set()  # (recurrence_id, due_date) for every occurrence that has been completed
+        self.version = 0  # goes up by one every time the series or completions held in memory change
+
+    def is_loaded(self, user_id):
+        return user_id is not None and self.user_id == user_id
+
+    def load(self, user_id):
+        if self.is_loaded(user_id):
+            return
+        series = self.database.fetchall(queries.USER_RECURRENCES, (user_id,))
+        completed = self.database.fetchall(queries.USER_COMPLETIONS, (user_id,))
+        with self.lock:
+            self.user_id = user_id
+            self.series = {row[0]: Series(*row) for row in series}
+            self.completed = set(completed)
+            self.version += 1
+        # two indexed queries, however many times each series has been due
+
+    def clear(self):
+        with self.lock:
+            self.user_id = None
+            self.series = {}
+            self.completed = set()
+            self.version += 1
+
+    def add(self, user_id, category_id, title, description, start_date, priority, unit, every):
+        cur = self.database.write(queries.INSERT_RECURRENCE,
+                                  (user_id, category_id, title, description, priority, start_date, unit, every))
+        if self.is_loaded(user_id):
+            with self.lock:
+                self.series[cur.lastrowid] = Series(cur.lastrowid, title, priority, category_id, start_date, unit,
+                                                    every, None)
+                self.version += 1
+        return cur.lastrowid
+
+    def add_many(self, user_id, series):
+        added = []
+        with self.database.transaction():
+            for category_id, title, description, start_date, priority, unit, every, completed in series:
+                cur = self.database.execute(queries.INSERT_RECURRENCE, (user_id, category_id, title, description,
+                                                                        priority, start_date, unit, every))
+                record = Series(cur.lastrowid, title, priority, category_id, start_date, unit, every, None)
+                done = [(record.recurrence_id, due_date) for due_date in completed
+                        if record.is_due(date.fromisoformat(due_date))]
+                self.database.executemany(queries.INSERT_COMPLETION, done)
+                added.append((record, done))
+        # every series and its completions are inserted in one transaction, only dates that the series really
+        # falls due on are kept as completed
+        if self.is_loaded(user_id):
+            with self.lock:
+                for record, done in added:
+                    self.series[record.recurrence_id] = record
+                    self.completed.update(done)
+                self.version += 1
+        return [record.recurrence_id for record, done in added]
+        # series is a list of (category_id, title, description, start_date, priority, unit, every, completed dates)
+        # from the bulk import, the new recurrence_ids are returned
+
+    def get(self, user_id, recurrence_id, due_date):
+        self.load(user_id)
+        with self.lock:
+            series = self.series.get(recurrence_id)
+            if series is None or not series.is_due(date.fromisoformat(due_date)):
+                return None
+            status = "completed" if (recurrence_id, due_date) in self.completed else "pending"
+            return series.row(date.fromisoformat(due_date), status)
+        # the task list row for one occurrence, or None if the series does not fall due on that date
+
+    def description(self, user_id, recurrence_id):
+        return self.database.fetchvalue("SELECT description FROM Recurrences WHERE recurrence_id = ? AND user_id = ?",
+                                        (recurrence_id, user_id))
+
+    def update(self, user_id, recurrence_id, changes):
+        self.load(user_id)
+        with self.lock:
+            old = self.series.get(recurrence_id)
+            completed = [due_date for key, due_date in self.completed if key == recurrence_id]
+        columns = ", ".join(f"{column} = ?" for column in changes)
+        moved = None
+        with self.database.transaction():
+            self.database.execute(f"UPDATE Recurrences SET {columns} WHERE recurrence_id = ? AND user_id = ?",
+                                  tuple(changes.values()) + (recurrence_id, user_id))
+            row = self.database.fetchone(queries.RECURRENCE, (recurrence_id, user_id))
+            if row is not None and old is not None and "start_date" in changes:
+                new = Series(*row)
+                moved = [new.nth(old.index_from(day)).isoformat() for day in map(date.fromisoformat, completed)
+                         if old.is_due(day)]
+                self.database.execute("DELETE FROM RecurrenceCompletions WHERE recurrence_id = ?", (recurrence_id,))
+                self.database.executemany(queries.INSERT_COMPLETION, [(recurrence_id, day) for day in moved])
+            # when the series is moved, each completed occurrence moves with it (the nth occurrence stays
+            # completed), in the same transaction, so an occurrence that was done can not come back as overdue
+        with self.lock:
+            if row is not None:
+                self.series[recurrence_id] = Series(*row)
+            if moved is not None:
+                self.completed = {key for key in self.completed if key[0] != recurrence_id}
+                self.completed.update((recurrence_id, day) for day in moved)
+            self.version += 1
+        # changes apply to the whole series, the in-memory record is read back once SQLite has committed
+
+    def complete(self, user_id, occurrences):
+        self.load(user_id)
+        with self.lock:
+            occurrences = [(recurrence_id, due_date) for recurrence_id, due_date in occurrences
+                           if recurrence_id in self.series
+                           and self.series[recurrence_id].is_due(date.fromisoformat(due_date))]
+        # only dates that the series really falls due on can be completed
+        with self.database.transaction():
+            self.database.executemany(queries.INSERT_COMPLETION, occurrences)
+        with self.lock:
+            self.completed.update(occurrences)
+            self.version += 1
+        return occurrences
+        # each occurrence is completed on its own, the rest of the series stays pending
+
+    def move(self, user_id, recurrence_ids, category_id):
+        self.load(user_id)
+        recurrence_ids = list(recurrence_ids)
+        self.database.write("UPDATE Recurrences SET category_id = ? WHERE user_id = ? AND recurrence_id IN "
+                            "(SELECT value FROM json_each(?))", (category_id, user_id, json.dumps(recurrence_ids)))
+        with self.lock:
+            for recurrence_id in recurrence_ids:
+                series = self.series.get(recurrence_id)
+                if series is not None:
+                    series.category_id = category_id
+            self.version += 1
+
+    def delete(self, user_id, recurrence_ids):
+        self.load(user_id)
+        recurrence_ids = list(recurrence_ids)
+        ids = json.dumps(recurrence_ids)
+        with self.database.transaction():
+            self.database.execute("DELETE FROM RecurrenceCompletions WHERE recurrence_id IN (SELECT recurrence_id "
+                                  "FROM Recurrences WHERE user_id = ? AND recurrence_id IN (SELECT value FROM "
+                                  "json_each(?)))", (user_id, ids))
+            self.database.execute("DELETE FROM Recurrences WHERE user_id = ? AND recurrence_id IN "
+                                  "(SELECT value FROM json_each(?))", (user_id, ids))
+        with self.lock:
+            for recurrence_id in recurrence_ids:
+                self.series.pop(recurrence_id, None)
+            self.completed = {key for key in self.completed if key[0] in self.series}
+            self.version += 1
+        # deleting an occurrence deletes its whole series, along with every completion it has
+
+    def current(self, series, today):
+        last = series.last_before(today)
+        if last is not None and (series.recurrence_id, last.isoformat()) not in self.completed:
+            return last
+        for day in series.between(today, date.max):
+            if (series.recurrence_id, day.isoformat()) not in self.completed:
+                return day
+        return None
+        # the occurrence that a series shows as pending: the last one that was missed, or else the next one that has
+        # not been completed early. Only the latest missed occurrence counts, so a daily chore that was not done for
+        # a week is one overdue task rather than seven
+
+    def occurrences(self, user_id, filter_type, category_id=None, today=None, week_end=None):
+        self.load(user_id)
+        today_obj = date.fromisoformat(today)
+        rows = []
+        with self.lock:
+            if filter_type == "completed":
+                return [self.series[recurrence_id].row(date.fromisoformat(due_date), "completed")
+                        for recurrence_id, due_date in self.completed if recurrence_id in self.series]
+            for series in self.series.values():
+                if filter_type == "category" and series.category_id != category_id:
+                    continue
+                if filter_type == "today":
+                    days = [today_obj] if series.is_due(today_obj) else []
+                elif filter_type == "week":
+                    days = series.between(today_obj, date.fromisoformat(week_end))
+                elif filter_type == "overdue":
+                    last = series.last_before(today_obj)
+                    days = [last] if last is not None else []
+                else:
+                    current = self.current(series, today_obj)
+                    days = [current] if current is not None else []
+                rows.extend(series.row(day) for day in days
+                            if (series.recurrence_id, day.isoformat()) not in self.completed)
+        return rows
+        # expands each series only over the dates the TaskListScreen filter covers, so nothing is stored for
+        # occurrences that are never looked at
+
+    def search(self, user_id, words, today):
+        self.load(user_id)
+        found = self.database.fetchall(queries.SEARCH_RECURRENCES, (user_id,))
+        today_obj = date.fromisoformat(today)
+        rows = []
+        with self.lock:
+            for recurrence_id, title, description in found:
+                text = "".join(c.lower() if c.isalnum() else " " for c in f"{title} {description or ''}").split()
+                if not all(any(word.startswith(search_word.lower()) for word in text) for search_word in words):
+                    continue
+                # the same rule as the TaskSearch index, every word that was typed starts a word in the title or
+                # description
+                series = self.series.get(recurrence_id)
+                current = self.current(series, today_obj) if series is not None else None
+                if current is not None:
+                    rows.append(series.row(current))
+        return sorted(rows, key=row_order)
+        # each matching series is found as the occurrence it shows as pending. A user has few series, so they are
+        # matched here rather than with a second full text index
+
+    def due(self, user_id, today, last):
+        self.load(user_id)
+        rows = []
+        with self.lock:
+            for series in self.series.values():
+                days = list(series.between(today, last))
+                missed = series.last_before(today)
+                if missed is not None:
+                    days.insert(0, missed)
+                rows.extend((occurrence_id(series.recurrence_id, day.isoformat()), series.title, day.isoformat())
+                            for day in days if (series.recurrence_id, day.isoformat()) not in self.completed)
+        return rows
+        # (id, title, due_date) for every pending occurrence that the reminders cover, the same shape as DUE_TASKS
+
+    def stats(self, user_id, today):
+        self.load(user_id)
+        today_obj = date.fromisoformat(today)
+        pending, due_today, overdue = {}, 0, 0
+        with self.lock:
+            for series in self.series.values():
+                due_today += series.is_due(today_obj) and (series.recurrence_id, today) not in self.completed
+                # the same rule as the "today" filter, so the dashboard and the list always agree
+                current = self.current(series, today_obj)
+                if current is None:
+                    continue
+                pending[series.category_id] = pending.get(series.category_id, 0) + 1
+                overdue += current < today_obj
+            completed = sum(1 for recurrence_id, due_date in self.completed if recurrence_id in self.series)
+        return pending, due_today, overdue, completed
+        # each series adds its one pending occurrence to the dashboard counts, and every completed occurrence
+
+
+recurrence_repository = RecurrenceRepository()  # the repository that the screens and reminders read series through
@@ -0,0 +1,109 @@
+from datetime import date
+
+from kivy.clock import Clock
+from plyer import notification
+
+from database import db
+from db_worker import worker
+from recurrences import recurrence_repository
+import queries
+import dates
+
+BUCKETS = ("overdue", "today", "tomorrow", "3 days")  # the order the summary notifications are sent in
+TITLES = {
+    "overdue": "Overdue tasks",
+    "today": "Tasks due today",
+    "tomorrow": "Tasks due tomorrow",
+    "3 days": "Tasks due in 3 days",
+}
+MAX_TITLES = 3  # how many task titles are named in one notification before the rest are counted
+
+
+def bucket_for(days_left):
+    if days_left < 0:
+        return "overdue"
+    if days_left == 0:
+        return "today"
+    if days_left == 1:
+        return "tomorrow"
+    if days_left == 3:
+        return "3 days"
+    return None
+    # tasks due in 2 days are not reminded about, the same as before
+
+
+def summary(titles):
+    named = ", ".join(f"'{title}'" for title in titles[:MAX_TITLES])
+    if len(titles) > MAX_TITLES:
+        named += f" and {len(titles) - MAX_TITLES} more"
+    return named
+
+
+class ReminderScheduler:  # sends due task reminders in the background, one summary notification per bucket
+    def __init__(self, database=db, interval=15 * 60, recurrences=recurrence_repository):
+        self.database = database
+        self.recurrences = recurrences
+        self.interval = interval  # seconds between checks while the app is open
+        self.user_id = None
+        self.event = None
+
+    def start(self, user_id):
+        self.stop()
+        self.user_id = user_id
+        self.event = Clock.schedule_interval(self.check, self.interval)
+        self.check()
+        # checks straight away and then again every interval, so tasks that become due while the app is open
+        # are reminded about too
+
+    def stop(self):
+        if self.event is not None:
+            self.event.cancel()
+            self.event = None
+        self.user_id = None
+
+    def check(self, *args):
+        user_id = self.user_id
+        if user_id is not None:
+            worker.submit(lambda: self.find_due_tasks(user_id, dates.today()), self.notify)
+        # the query runs on the database worker, only the notifications are sent from the main thread
+
+    def find_due_tasks(self, user_id, today):  # runs on the database worker
+        last = dates.future_date(3)
+        rows = self.database.fetchall(queries.DUE_TASKS, (user_id, last))
+        rows += self.recurrences.due(user_id, date.fromisoformat(today), date.fromisoformat(last))
+        # repeating tasks are expanded only over the dates the reminders cover, each occurrence has its own
+        # SentReminders rows in the same way as a task
+        if not rows:
+            return {}
+        sent = set(self.database.fetchall(queries.SENT_REMINDERS, (today,)))
+        today_obj = date.fromisoformat(today)
+        due = {}
+        new_reminders = []
+        for task_id, title, due_date in rows:
+            bucket = bucket_for(dates.days_until(due_date, today_obj))
+            if bucket is None or (task_id, bucket) in sent:
+                continue
+            due.setdefault(bucket, []).append(title)
+            new_reminders.append((task_id, bucket, today))
+        # each task is reminded about at most once a day for each bucket, even if the app is restarted
+        if new_reminders:
+            with self.database.transaction():
+                self.database.execute("DELETE FROM SentReminders WHERE sent_on < ?", (today,))
+                self.database.executemany("INSERT OR IGNORE INTO SentReminders (task_id, bucket, sent_on) "
+                                          "VALUES (?, ?, ?)", new_reminders)
+            # reminders from earlier days are no longer needed, so they are removed in the same transaction
+        return due
+
+    def notify(self, due):
+        for bucket in BUCKETS:
+            titles = due.get(bucket)
+            if titles:
+                notification.notify(
+                    title=TITLES[bucket],
+                    message=summary(titles),
+                    app_name="TaskSphere"
+                )
+        # one notification for each bucket instead of one for every task
+
+
+reminders = ReminderScheduler()  # the scheduler that is started when a user logs in
@@ -0,0 +1,332 @@
+import sqlite3
+from contextlib import contextmanager
+
+from database import db
+from categories import category_cache
+from tasks import task_repository
+from recurrences import recurrence_repository, occurrence_id, parse_occurrence_id, row_order, merge_rows
+from passwords import hash_password, verify_password
+from validation import validate_task, validate_category, validate_username, validate_password, validate_repeat
+import queries
+import dates
+
+# Everything the app does with users, tasks and categories, without any Kivy. The screens in main.py and the
+# HTTP API in api.py both call these methods, so the rules only live in one place.
+
+
+class ServiceError(Exception):  # a request that can not be carried out, the message can be shown to the user
+    pass
+
+
+class TaskService:
+    def __init__(self, database=db, categories=category_cache, tasks=task_repository,
+                 recurrences=recurrence_repository):
+        self.database = database
+        self.categories = categories
+        self.tasks = tasks
+        self.recurrences = recurrences
+
+    # users
+
+    def log_in(self, username, password):
+        result = self.database.fetchone(queries.LOGIN, (username,))
+        if not result:
+            return None
+        user_id, stored_password_hash = result
+        matches, needs_rehash = verify_password(password, stored_password_hash)
+        if not matches:
+            return None
+        if needs_rehash:
+            self.database.write("UPDATE Users SET password_hash = ? WHERE user_id = ?",
+                                (hash_password(password), user_id))
+            # old unsalted SHA-256 hashes (or hashes with an older cost) are replaced now that the password is
+            # known, so every account moves to the new hash the next time it logs in
+        return user_id
+        # returns the user's id if the password matches the stored hash, otherwise None
+
+    def sign_up(self, username, password):
+        for valid, message in (validate_username(username), validate_password(password)):
+            if not valid:
+                raise ServiceError(message)
+        password_hash = hash_password(password)
+        # the password is only hashed once both checks have passed, with a new random salt for every user
+        try:
+            with self.database.transaction():
+                cur = self.database.execute("INSERT INTO Users (username, password_hash) VALUES (?, ?)",
+                                            (username, password_hash))
+                # the UNIQUE constraint on username raises IntegrityError if the name is taken
+                self.database.execute("INSERT INTO Categories (category_name, user_id) VALUES ('None', ?)",
+                                      (cur.lastrowid,))
+                # adds "None" to the Categories table, using the user_id that the insert has just created
+        except sqlite3.IntegrityError:
+            raise ServiceError("Username taken.")
+        return cur.lastrowid
+        # both inserts are committed together on one connection, so there can never be a user without their
+        # "None" category
+
+    # categories
+
+    def category_names(self, user_id):
+        return self.categories.names(user_id)
+
+    def category_id(self, user_id, category_name):
+        return self.categories.get_id(user_id, category_name)
+
+    def category_name(self, user_id, category_id):
+        return self.categories.get_name(user_id, category_id)
+
+    def create_category(self, user_id, category_name):
+        valid, message = validate_category(category_name)
+        if not valid:
+            raise ServiceError(message)
+        try:
+            return self.categories.add(user_id, category_name)
+        except sqlite3.IntegrityError:
+            raise ServiceError("Category already exists")
+            # the unique (user_id, category_name) index rejects a second category with the same name
+
+    # tasks
+
+    def check_task(self, title, due_date, description, category, priority):
+        valid, message = validate_task(title, due_date, description, category, priority)
+        if not valid:
+            raise ServiceError(message)
+
+    def create_task(self, user_id, title, due_date, description, category, priority):
+        self.check_task(title, due_date, description, category, priority)
+        category_id = self.category_id(user_id, category)
+        if category_id is None:
+            raise ServiceError("Please select a category.")
+        task_id = self.tasks.insert(user_id, category_id, title, description, dates.to_storage(due_date), priority)
+        return task_id, category_id
+        # due_date is typed as DD-MM-YYYY and stored as YYYY-MM-DD, the new task_id comes from the insert itself
+
+    def create_recurring_task(self, user_id, title, due_date, description, category, priority, unit, every):
+        self.check_task(title, due_date, description, category, priority)
+        valid, message = validate_repeat(unit, str(every))
+        if not valid:
+            raise ServiceError(message)
+        category_id = self.category_id(user_id, category)
+        if category_id is None:
+            raise ServiceError("Please select a category.")
+        start_date = dates.to_storage(due_date)
+        recurrence_id = self.recurrences.add(user_id, category_id, title, description, start_date, priority, unit,
+                                             int(every))
+        return occurrence_id(recurrence_id, start_date), category_id
+        # the series is stored once and its first occurrence is due on due_date, the id returned is that
+        # occurrence's so ViewTask can show it straight away
+
+    def split_ids(self, task_ids):
+        tasks, occurrences = [], []
+        for task_id in task_ids:
+            occurrence = parse_occurrence_id(task_id)
+            if occurrence is None:
+                tasks.append(int(task_id))
+            else:
+                occurrences.append(occurrence)
+        return tasks, occurrences
+        # separates ordinary task_ids from (recurrence_id, due_date) occurrences, the screens pass both around
+
+    def update_task(self, user_id, task_id, title, due_date, description, category, priority):
+        self.check_task(title, due_date, description, category, priority)
+        category_id = self.category_id(user_id, category)
+        if category_id is None:
+            raise ServiceError("Please select a category.")
+        occurrence = parse_occurrence_id(task_id)
+        if occurrence is not None:
+            recurrence_id, old_due_date = occurrence
+            if self.recurrences.get(user_id, recurrence_id, old_due_date) is None:
+                raise ServiceError("Task not found")
+            start_date = self.database.fetchvalue("SELECT start_date FROM Recurrences WHERE recurrence_id = ? AND "
+                                                  "user_id = ?", (recurrence_id, user_id))
+            shift = dates.days_between(old_due_date, dates.to_storage(due_date))
+            self.recurrences.update(user_id, recurrence_id, {
+                "title": title,
+                "start_date": dates.add_days(start_date, shift),
+                "description": description,
+                "priority": priority,
+                "category_id": category_id,
+            })
+            return category_id
+            # editing an occurrence edits its whole series, and changing its due date moves every occurrence by
+            # the same number of days
+        self.tasks.update(user_id, int(task_id), {
+            "title": title,
+            "due_date": dates.to_storage(due_date),
+            "description": description,
+            "priority": priority,
+            "category_id": category_id,
+        })
+        return category_id
+        # the task repository only writes the columns that have changed
+
+    def complete_task(self, user_id, task_id):
+        occurrence = parse_occurrence_id(task_id)
+        if occurrence is not None:
+            return bool(self.recurrences.complete(user_id, [occurrence]))
+            # only this occurrence is completed, the rest of its series stays pending
+        return self.tasks.complete(user_id, int(task_id))
+
+    def delete_task(self, user_id, task_id):
+        occurrence = parse_occurrence_id(task_id)
+        if occurrence is not None:
+            self.recurrences.delete(user_id, [occurrence[0]])
+            return
+            # deleting a repeating task deletes the whole series
+        self.tasks.delete(user_id, int(task_id))
+
+    @contextmanager
+    def bulk_action(self):
+        try:
+            with self.database.transaction():
+                yield
+        except Exception:
+            self.tasks.clear()
+            self.recurrences.clear()
+            raise
+        # the tasks and the repeating tasks in a selection are written in one transaction. The repositories update
+        # their memory as each part is written, so if the transaction is rolled back they are cleared and load
+        # again from SQLite rather than keep changes that were never committed
+
+    def complete_tasks(self, user_id, task_ids):
+        tasks, occurrences = self.split_ids(task_ids)
+        with self.bulk_action():
+            done = self.tasks.complete_many(user_id, tasks) if tasks else []
+            if occurrences:
+                done += [occurrence_id(*occurrence) for occurrence in self.recurrences.complete(user_id, occurrences)]
+        return done
+
+    def delete_tasks(self, user_id, task_ids):
+        tasks, occurrences = self.split_ids(task_ids)
+        with self.bulk_action():
+            done = self.tasks.delete_many(user_id, tasks) if tasks else []
+            if occurrences:
+                self.recurrences.delete(user_id, {recurrence_id for recurrence_id, due_date in occurrences})
+                done += [occurrence_id(*occurrence) for occurrence in occurrences]
+        return done
+
+    def move_tasks(self, user_id, task_ids, category):
+        category_id = self.category_id(user_id, category)
+        if category_id is None:
+            raise ServiceError("Please select a category.")
+        tasks, occurrences = self.split_ids(task_ids)
+        with self.bulk_action():
+            if tasks:
+                self.tasks.move_many(user_id, tasks, category_id)
+            if occurrences:
+                self.recurrences.move(user_id, {recurrence_id for recurrence_id, due_date in occurrences},
+                                      category_id)
+        return category_id
+        # each of these is one transaction, with one statement for the tasks (and one for any repeating tasks),
+        # however many are selected
+
+    def get_task(self, user_id, task_id):
+        occurrence = parse_occurrence_id(task_id)
+        if occurrence is not None:
+            row = self.recurrences.get(user_id, *occurrence)
+            if row is None:
+                raise ServiceError("Task not found")
+            return row + (self.recurrences.description(user_id, occurrence[0]),)
+        row = self.database.fetchone(f"SELECT {queries.TASK_LIST_COLUMNS}, description FROM Tasks "
+                                     f"WHERE task_id = ? AND user_id = ?", (int(task_id), user_id))
+        if row is None:
+            raise ServiceError("Task not found")
+        return row
+        # the task list columns with the description on the end, only if the task belongs to the user
+
+    def task_description(self, user_id, task_id):
+        occurrence = parse_occurrence_id(task_id)
+        if occurrence is not None:
+            return self.recurrences.description(user_id, occurrence[0])
+        return self.database.fetchvalue(queries.TASK_DESCRIPTION, (int(task_id), user_id))
+        # a repeating task's occurrences all share the description stored with the series
+
+    def task_list_query(self, user_id, filter_type, category=None):
+        today = dates.today()
+        # Each filter has its own query in queries.py so that it is answered by a matching index
+        if filter_type == "category" and category:
+            return queries.CATEGORY_TASKS, (self.category_id(user_id, category), user_id)
+        elif filter_type == "today":
+            return queries.TODAY_TASKS, (today, user_id)
+        elif filter_type == "overdue":
+            return queries.OVERDUE_TASKS, (user_id, today)
+        elif filter_type == "week":
+            return queries.WEEK_TASKS, (user_id, today, dates.future_date(7))
+            # due dates are stored as YYYY-MM-DD, so both of these are range scans over the due date index
+        elif filter_type == "completed":
+            return queries.COMPLETED_TASKS, ("completed", user_id)
+        elif filter_type == "all":
+            return queries.ALL_TASKS, (user_id,)
+        return None, ()
+        # returns the TaskListQuery for a TaskListScreen filter and the parameters it needs
+
+    def cursor_row(self, after):
+        try:
+            task_id, due_date, priority = after
+            valid = isinstance(due_date, str) and isinstance(priority, int) and \
+                (isinstance(task_id, int) or parse_occurrence_id(task_id) is not None)
+        except (TypeError, ValueError):
+            valid = False
+        if not valid:
+            raise ServiceError("Malformed cursor")
+        return task_id, None, due_date, priority
+        # the start of a task list row for the last task on the page before, from the [task_id, due_date, priority]
+        # cursor that list_tasks returned with it
+
+    def list_tasks(self, user_id, filter_type, category=None, limit=50, after=None):
+        query, params = self.task_list_query(user_id, filter_type, category)
+        if query is None:
+            raise ServiceError(f"Unknown filter {filter_type}")
+        category_id = params[0] if filter_type == "category" else None
+        occurrences = self.recurrences.occurrences(user_id, filter_type, category_id, dates.today(),
+                                                   dates.future_date(7))
+        # the repeating tasks for the whole filter are worked out in memory, only for the dates the filter covers
+        if after is None:
+            tasks = self.database.fetchall(query.first_page, params + (limit,))
+        else:
+            last_row = self.cursor_row(after)
+            tasks = self.database.fetchall(query.next_page, params + query.after(last_row) + (limit,))
+            last = row_order(last_row, query.by_due_date)
+            occurrences = [row for row in occurrences if row_order(row, query.by_due_date) > last]
+        rows = merge_rows(tasks, occurrences, query.by_due_date)[:limit]
+        cursor = [rows[-1][0], rows[-1][2], rows[-1][3]] if len(rows) == limit else None
+        return rows, cursor
+        # tasks and occurrences are merged in the task list order and cut to one page. The cursor is passed back
+        # as after to fetch the next page, which carries on after the last row with keyset pagination, or is None
+        # once there are no more rows
+
+    def task_stats(self, user_id):
+        today = dates.today()
+        categories, pending = {}, 0
+        rows = self.database.fetchall(queries.TASK_STATS, (user_id,))
+        series_pending, series_today, series_overdue, completed = self.recurrences.stats(user_id, today)
+        counts = {}
+        for category_id, category_pending, category_completed in rows:
+            pending += category_pending
+            completed += category_completed
+            counts[category_id] = category_pending
+        for category_id, count in series_pending.items():
+            pending += count
+            counts[category_id] = counts.get(category_id, 0) + count
+        for category_id, count in counts.items():
+            name = self.category_name(user_id, category_id)
+            if name is not None:
+                categories[name] = count
+        overdue, due_today = self.database.fetchone(queries.DUE_COUNTS, (today, today, user_id, today))
+        return {"pending": pending, "completed": completed, "today": int(due_today) + series_today,
+                "overdue": int(overdue) + series_overdue, "categories": categories}
+        # every task number comes from the counters that the Tasks triggers keep, so no tasks are counted here.
+        # Each repeating task adds the one occurrence it has pending. categories holds the pending tasks in each
+        # category by name
+
+    def search_tasks(self, user_id, text, limit=200):
+        words = queries.search_words(text)
+        if not words:
+            return []
+        occurrences = self.recurrences.search(user_id, words, dates.today())
+        tasks = self.database.fetchall(queries.SEARCH_TASKS, (queries.search_match(text), user_id, limit))
+        return (occurrences + tasks)[:limit]
+        # matching repeating tasks come first, followed by the tasks ranked by the TaskSearch full text index
+
+
+services = TaskService()  # the service that the screens use, with the app's category cache and task repository
@@ -0,0 +1,100 @@
+import hashlib
+import os
+import secrets
+from datetime import datetime, timedelta, timezone
+
+from database import db
+import queries
+
+TOKEN_PATH = "session_token"  # where this device keeps the token of its logged in session
+SESSION_DAYS = 30  # how long a session lasts without being used
+
+
+def now(days=0):
+    return (datetime.now(timezone.utc) + timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+    # UTC times stored as text sort in time order, so expiry can be compared and range scanned
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class SessionStore:  # every session in the database, any number of users can be logged in at once
+    def __init__(self, database=db, days=SESSION_DAYS):
+        self.database = database
+        self.days = days
+
+    def create(self, user_id):
+        token = secrets.token_hex(32)
+        with self.database.transaction():
+            self.database.execute("DELETE FROM Sessions WHERE expires <= ?", (now(),))
+            # expired sessions are cleared out whenever a new one starts, through the index on expires
+            self.database.execute("INSERT INTO Sessions (token_hash, user_id, created, expires) VALUES (?, ?, ?, ?)",
+                                  (hash_token(token), user_id, now(), now(self.days)))
+        return token
+        # the token is only ever given to the client, the database keeps its hash
+
+    def user_for(self, token):
+        if not token:
+            return None
+        return self.database.fetchvalue(queries.SESSION_USER, (hash_token(token), now()))
+        # one primary key lookup, no matter how many users or sessions there are
+
+    def renew(self, token):
+        self.database.write("UPDATE Sessions SET expires = ? WHERE token_hash = ?",
+                            (now(self.days), hash_token(token)))
+
+    def delete(self, token):
+        self.database.write("DELETE FROM Sessions WHERE token_hash = ?", (hash_token(token),))
+        # only this session ends, other users and devices stay logged in
+
+
+class Session:  # this device's logged in user, found once at login or startup instead of by every screen
+    def __init__(self, store=None, token_path=TOKEN_PATH):
+        self.store = store or SessionStore()
+        self.token_path = token_path
+        self.token = None
+        self.user_id = None
+
+    def load(self):
+        try:
+            with open(self.token_path) as file:
+                token = file.read().strip()
+        except OSError:
+            token = None
+        self.user_id = self.store.user_for(token)
+        if self.user_id is not None:
+            self.token = token
+            self.store.renew(token)
+            # a session that keeps being used does not expire
+        return self.user_id
+        # finds the user whose session this device was using when the app was last closed
+
+    def log_in(self, user_id):
+        with self.store.database.transaction():
+            if self.token is not None:
+                self.store.delete(self.token)
+            token = self.store.create(user_id)
+        self.token = token
+        # the old session is ended and the new one started in one unit of work
+        with open(self.token_path, "w") as file:
+            file.write(self.token)
+        self.user_id = user_id
+        # starts a new session for the user and remembers its token on this device, without touching any other
+        # user's row
+
+    def log_out(self):
+        self.user_id = None
+        if self.token is not None:
+            self.store.delete(self.token)
+            self.token = None
+        try:
+            os.remove(self.token_path)
+        except OSError:
+            pass
+
+    def is_logged_in(self):
+        return self.user_id is not None
+
+
+session = Session()  # the session that every screen reads the logged in user from
@@ -0,0 +1,39 @@
+import json
+import time
+from datetime import datetime
+
+REPORT_PATH = "startup_times.jsonl"  # one line is added for every cold start, so start up times can be compared
+
+
+class StartupTimer:  # measures how long each stage of starting the app takes
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.marks = {}
+
+    def mark(self, stage):
+        if stage not in self.marks:
+            self.marks[stage] = (time.perf_counter() - self.start) * 1000
+        # the time in milliseconds from the start of the import to this stage, only the first time is kept
+
+    def report(self):
+        stages = {}
+        previous = 0
+        for stage, elapsed in self.marks.items():
+            stages[stage] = {"at_ms": round(elapsed, 1), "took_ms": round(elapsed - previous, 1)}
+            previous = elapsed
+        return {"started": datetime.now().isoformat(timespec="seconds"), "stages": stages}
+        # at_ms is the time since the start, took_ms is the time since the stage before
+
+    def save(self, path=REPORT_PATH):
+        report = self.report()
+        for stage, times in report["stages"].items():
+            print(f"startup {stage:<12} {times['took_ms']:8.1f} ms  (at {times['at_ms']:8.1f} ms)")
+        try:
+            with open(path, "a") as file:
+                file.write(json.dumps(report) + "\n")
+        except OSError:
+            pass  # the report is only for tracking start up times, it should never stop the app from starting
+        return report
+
+
+startup_timer = StartupTimer()  # started when this module is first imported, which is the first line of main.py
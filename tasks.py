@@ -0,0 +1,208 @@
+import json
+import threading
+
+from database import db
+import queries
+
+
+class Task:  # one task held in memory, __slots__ keeps each record small when a user has thousands of tasks
+    __slots__ = ("task_id", "category_id", "title", "due_date", "priority", "status")
+
+    def __init__(self, task_id, title, due_date, priority, status, category_id):
+        self.task_id = task_id
+        self.title = title
+        self.due_date = due_date
+        self.priority = priority
+        self.status = status
+        self.category_id = category_id
+        # the description is not kept in memory, it is only loaded when a task is opened
+
+    def row(self):
+        return self.task_id, self.title, self.due_date, self.priority, self.status, self.category_id
+        # the same shape as a row from the task list queries, so the TaskListScreen can show either
+
+
+def priority_order(task):
+    return -task.priority, -task.task_id
+
+
+def due_date_order(task):
+    return task.due_date or "", -task.priority, -task.task_id
+# these sort tasks in exactly the same order as the ORDER BY clauses of the task list queries
+
+
+def task_values(user_id, category_id, title, description, due_date, priority, status="pending"):
+    return user_id, category_id, title, description, due_date, priority, status
+    # the parameters for INSERT_TASK_WITH_STATUS, tasks are pending unless a status is given
+
+
+class TaskRepository:  # the logged in user's tasks, kept in memory and written through to SQLite
+    def __init__(self, database=db):
+        self.database = database
+        self.lock = threading.Lock()  # tasks are written on the database worker and read on the main thread
+        self.user_id = None  # the user whose tasks are loaded, None if nothing is loaded
+        self.tasks = {}  # task_id -> Task
+        self.by_status = {}  # status -> set of task_ids
+        self.by_category = {}  # category_id -> set of task_ids
+        self.by_due_date = {}  # due_date -> set of task_ids
+        self.version = 0  # goes up by one every time the tasks held in memory change
+
+    def is_loaded(self, user_id):
+        return user_id is not None and self.user_id == user_id
+
+    def load(self, user_id):
+        if self.is_loaded(user_id):
+            return
+        rows = self.database.fetchall(queries.USER_TASKS, (user_id,))
+        with self.lock:
+            self.clear_indexes()
+            for row in rows:
+                self.add_to_indexes(Task(*row))
+            self.user_id = user_id
+        # loads every task for the user in one query, after this the task list filters never need the database
+
+    def clear(self):
+        with self.lock:
+            self.clear_indexes()
+            self.user_id = None
+
+    def clear_indexes(self):
+        self.version += 1
+        self.tasks = {}
+        self.by_status = {}
+        self.by_category = {}
+        self.by_due_date = {}
+
+    def add_to_indexes(self, task):
+        self.version += 1
+        self.tasks[task.task_id] = task
+        self.by_status.setdefault(task.status, set()).add(task.task_id)
+        self.by_category.setdefault(task.category_id, set()).add(task.task_id)
+        self.by_due_date.setdefault(task.due_date, set()).add(task.task_id)
+
+    def remove_from_indexes(self, task):
+        self.version += 1
+        del self.tasks[task.task_id]
+        self.by_status[task.status].discard(task.task_id)
+        self.by_category[task.category_id].discard(task.task_id)
+        self.by_due_date[task.due_date].discard(task.task_id)
+
+    def insert(self, user_id, category_id, title, description, due_date, priority):
+        cur = self.database.write(queries.INSERT_TASK, (user_id, category_id, title, description, due_date, priority))
+        if self.is_loaded(user_id):
+            with self.lock:
+                self.add_to_indexes(Task(cur.lastrowid, title, due_date, priority, "pending", category_id))
+        return cur.lastrowid
+        # returns the new task_id, which comes from the insert itself rather than searching for the task afterwards
+
+    def insert_many(self, user_id, tasks):
+        rows = [task_values(user_id, *task) for task in tasks]
+        if not rows:
+            return []
+        with self.database.transaction():
+            self.database.executemany(queries.INSERT_TASK_WITH_STATUS, rows)
+            last_id = self.database.fetchvalue("SELECT last_insert_rowid()")
+        task_ids = range(last_id - len(rows) + 1, last_id + 1)
+        # every row is inserted in one transaction, which holds the write lock, and task_id is AUTOINCREMENT, so
+        # the new ids are the len(rows) numbers that end with the last one inserted
+        if self.is_loaded(user_id):
+            with self.lock:
+                for task_id, (_, category_id, title, description, due_date, priority, status) in zip(task_ids, rows):
+                    self.add_to_indexes(Task(task_id, title, due_date, priority, status, category_id))
+        return list(task_ids)
+        # tasks is a list of (category_id, title, description, due_date, priority) with an optional status on the
+        # end, the new task_ids are returned
+
+    def update(self, user_id, task_id, changes):
+        task = self.tasks.get(task_id) if self.is_loaded(user_id) else None
+        if task is not None:
+            changes = {column: value for column, value in changes.items()
+                       if column not in Task.__slots__ or getattr(task, column) != value}
+        # only the columns that have actually changed are written (the description is not kept in memory, so
+        # it is always written if it is passed in)
+        if not changes:
+            return False
+        columns = ", ".join(f"{column} = ?" for column in changes)
+        self.database.write(f"UPDATE Tasks SET {columns} WHERE task_id = ? AND user_id = ?",
+                            tuple(changes.values()) + (task_id, user_id))
+        if task is not None:
+            with self.lock:
+                self.remove_from_indexes(task)
+                for column, value in changes.items():
+                    if column in Task.__slots__:
+                        setattr(task, column, value)
+                self.add_to_indexes(task)
+        return True
+        # the in-memory record is only changed once SQLite has committed, so it never holds unsaved changes
+
+    def complete(self, user_id, task_id):
+        return self.update(user_id, task_id, {"status": "completed"})
+
+    def delete(self, user_id, task_id):
+        self.database.write("DELETE FROM Tasks WHERE task_id = ? AND user_id = ?", (task_id, user_id))
+        if self.is_loaded(user_id):
+            with self.lock:
+                task = self.tasks.get(task_id)
+                if task is not None:
+                    self.remove_from_indexes(task)
+
+    def complete_many(self, user_id, task_ids):
+        return self.update_many(user_id, task_ids, "status", "completed")
+
+    def move_many(self, user_id, task_ids, category_id):
+        return self.update_many(user_id, task_ids, "category_id", category_id)
+
+    def update_many(self, user_id, task_ids, column, value):
+        task_ids = list(task_ids)
+        self.database.write(f"UPDATE Tasks SET {column} = ? WHERE user_id = ? AND task_id IN "
+                            f"(SELECT value FROM json_each(?))", (value, user_id, json.dumps(task_ids)))
+        # one set-based statement however many tasks are selected, the ids are passed as a single JSON array so
+        # there is no limit on how many there can be
+        if self.is_loaded(user_id):
+            with self.lock:
+                for task_id in task_ids:
+                    task = self.tasks.get(task_id)
+                    if task is not None:
+                        self.remove_from_indexes(task)
+                        setattr(task, column, value)
+                        self.add_to_indexes(task)
+        return task_ids
+
+    def delete_many(self, user_id, task_ids):
+        task_ids = list(task_ids)
+        self.database.write("DELETE FROM Tasks WHERE user_id = ? AND task_id IN (SELECT value FROM json_each(?))",
+                            (user_id, json.dumps(task_ids)))
+        if self.is_loaded(user_id):
+            with self.lock:
+                for task_id in task_ids:
+                    task = self.tasks.get(task_id)
+                    if task is not None:
+                        self.remove_from_indexes(task)
+        return task_ids
+
+    def select(self, filter_type, category_id=None, today=None, week_end=None):
+        with self.lock:
+            if filter_type == "completed":
+                ids = self.by_status.get("completed", set())
+            else:
+                pending = self.by_status.get("pending", set())
+                if filter_type == "category":
+                    ids = self.by_category.get(category_id, set()) & pending
+                elif filter_type == "today":
+                    ids = self.by_due_date.get(today, set()) & pending
+                elif filter_type == "overdue":
+                    ids = set().union(*(task_ids for due_date, task_ids in self.by_due_date.items()
+                                        if due_date and due_date < today)) & pending
+                elif filter_type == "week":
+                    ids = set().union(*(task_ids for due_date, task_ids in self.by_due_date.items()
+                                        if due_date and today <= due_date <= week_end)) & pending
+                else:
+                    ids = pending
+            tasks = [self.tasks[task_id] for task_id in ids]
+        order = due_date_order if filter_type in ("overdue", "week") else priority_order
+        tasks.sort(key=order)
+        return [task.row() for task in tasks]
+        # answers any of the TaskListScreen filters from the in-memory indexes, in the same order as the queries
+
+
+task_repository = TaskRepository()  # the repository that every screen reads and writes tasks through
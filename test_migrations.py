@@ -0,0 +1,43 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from database import Database
+from migrations import migrate, check_query_plans, LATEST_VERSION
+
+# Migrates a temporary database and checks the EXPLAIN QUERY PLAN of every hot query in queries.py, so a change that
+# makes one of them scan a table or sort its results fails here instead of only when migrations.py is run by hand.
+# Run with python -m pytest or python -m unittest.
+
+SHIPPED_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "task_manager.db")
+
+
+class QueryPlanTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "task_manager.db")
+        self.database = None
+
+    def tearDown(self):
+        if self.database is not None:
+            self.database.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def check(self):
+        self.database = Database(self.path)
+        self.assertEqual(migrate(self.database), LATEST_VERSION)
+        check_query_plans(self.database)
+        # raises QueryPlanError, which fails the test, if any hot query is not answered from an index
+
+    def test_new_database(self):
+        self.check()
+
+    def test_shipped_database(self):
+        shutil.copyfile(SHIPPED_DB, self.path)
+        self.check()
+        # the copy is brought up from whatever version task_manager.db is at, the file itself is never changed
+
+
+if __name__ == "__main__":
+    unittest.main()
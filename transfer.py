@@ -0,0 +1,220 @@
+import csv
+import json
+import sys
+import time
+
+from database import db
+from categories import category_cache
+from tasks import task_repository
+from recurrences import recurrence_repository, UNITS
+from validation import validate_task, validate_category, validate_repeat, PRIORITIES, PRIORITY_NAMES
+import queries
+from migrations import migrate
+import dates
+
+FIELDS = ("title", "description", "due_date", "category", "priority", "status", "repeat", "every", "completed")
+# the columns of an exported file, due_date is DD-MM-YYYY like the date inputs in the app. repeat, every and
+# completed are only filled in for a repeating task: repeat is Daily, Weekly or Monthly, due_date is its first
+# occurrence and completed lists the DD-MM-YYYY dates of the occurrences that have been done
+UNIT_NAMES = {unit: name for name, unit in UNITS.items()}  # "day" -> "Daily", the way the Repeat spinner shows it
+MAX_ERRORS = 100  # only the first errors are kept, so a broken file does not fill memory with messages
+
+
+def is_csv(path):
+    return path.lower().endswith(".csv")
+    # any other file is read and written as JSON lines, one task object per line
+
+
+def read_rows(path):
+    with open(path, newline="", encoding="utf-8") as file:
+        if is_csv(path):
+            for row in csv.DictReader(file):
+                yield row, None
+        else:
+            for line in file:
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    yield None, "not valid JSON"
+                    continue
+                if not isinstance(row, dict):
+                    yield None, "not a JSON object"
+                    continue
+                yield row, None
+    # yields (row, None) for each task, or (None, error_message) for a line that can not be read, so one broken
+    # line is reported like any other bad row instead of stopping the import. The file is read a line at a time
+    # however big it is
+
+
+def write_rows(path, rows):
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.DictWriter(file, fieldnames=FIELDS) if is_csv(path) else None
+        if writer is not None:
+            writer.writeheader()
+        for row in rows:
+            if writer is not None:
+                writer.writerow(row)
+            else:
+                file.write(json.dumps(row) + "\n")
+            count += 1
+    return count
+
+
+def parse_repeat(row):
+    repeat = str(row.get("repeat") or "").strip()
+    if not repeat:
+        return None, None
+    unit = UNITS.get(repeat.capitalize(), repeat.lower())
+    every = str(row.get("every") or "1")
+    valid, error_message = validate_repeat(unit, every)
+    if not valid:
+        return None, error_message
+    try:
+        completed = [dates.to_storage(day) for day in str(row.get("completed") or "").split()]
+    except ValueError:
+        return None, "Completed dates must be in format DD-MM-YYYY."
+    return (unit, int(every), completed), None
+    # (unit, every, completed dates) for a repeating task, or None for an ordinary one. repeat can be Daily, Weekly
+    # or Monthly, or day, week or month
+
+
+def parse_row(row, category_ids, user_id):
+    title = str(row.get("title") or "")
+    description = str(row.get("description") or "")
+    due_date = str(row.get("due_date") or "")
+    category = str(row.get("category") or "None")
+    priority = PRIORITIES.get(str(row.get("priority") or "").strip().lower())
+    status = "completed" if str(row.get("status") or "").strip().lower() == "completed" else "pending"
+
+    valid, error_message = validate_task(title, due_date, description, category, priority)
+    if not valid:
+        return None, error_message
+    # the same rules as CreateTask, so an imported task could also have been typed in
+
+    category_id = category_ids.get(category)
+    if category_id is None:
+        valid, error_message = validate_category(category)
+        if not valid:
+            return None, error_message
+        # a new category has to follow the same rules as one made on the CreateCategory screen
+        category_id = category_cache.add(user_id, category)
+        category_ids[category] = category_id
+    # categories are looked up in one dictionary that is loaded once, and any that are missing are created once
+    return (category_id, title, description, dates.to_storage(due_date), priority, status), None
+
+
+def import_tasks(user_id, path, batch_size=1000):
+    started = time.perf_counter()
+    category_ids = {name: category_cache.get_id(user_id, name) for name in category_cache.names(user_id)}
+    read = imported = 0
+    errors = []
+    batch = []
+    series = []
+    for line_number, (row, error_message) in enumerate(read_rows(path), start=1):
+        read += 1
+        task = repeat = None
+        if row is not None:
+            repeat, error_message = parse_repeat(row)
+            if error_message is None:
+                task, error_message = parse_row(row, category_ids, user_id)
+        if task is None:
+            if len(errors) < MAX_ERRORS:
+                errors.append(f"row {line_number}: {error_message}")
+            continue
+        if repeat is not None:
+            series.append(task[:5] + repeat)
+            if len(series) >= batch_size:
+                imported += len(recurrence_repository.add_many(user_id, series))
+                series = []
+            continue
+        # a repeating task is stored as one series with its completions, its status column is not used
+        batch.append(task)
+        if len(batch) >= batch_size:
+            imported += len(task_repository.insert_many(user_id, batch))
+            batch = []
+    imported += len(task_repository.insert_many(user_id, batch))
+    imported += len(recurrence_repository.add_many(user_id, series))
+    # each batch is inserted with one executemany in one transaction, and only one batch is held at a time
+
+    seconds = time.perf_counter() - started
+    return {
+        "read": read,
+        "imported": imported,
+        "skipped": read - imported,
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(read / seconds) if seconds else 0,
+    }
+
+
+def export_rows(user_id, database=db, batch_size=1000):
+    names = {category_cache.get_id(user_id, name): name for name in category_cache.names(user_id)}
+    cur = database.execute("SELECT title, description, due_date, category_id, priority, status FROM Tasks "
+                           "WHERE user_id = ? ORDER BY task_id", (user_id,))
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            break
+        for title, description, due_date, category_id, priority, status in rows:
+            yield {
+                "title": title,
+                "description": description or "",
+                "due_date": dates.to_display(due_date),
+                "category": names.get(category_id, "None"),
+                "priority": PRIORITY_NAMES.get(priority, priority),
+                "status": status,
+            }
+    # the cursor is read a batch at a time, so exporting never holds every task in memory
+
+    completed = {}
+    for recurrence_id, due_date in database.fetchall(queries.USER_COMPLETIONS, (user_id,)):
+        completed.setdefault(recurrence_id, []).append(due_date)
+    for recurrence_id, title, description, start_date, category_id, priority, unit, every in \
+            database.fetchall(queries.EXPORT_RECURRENCES, (user_id,)):
+        yield {
+            "title": title,
+            "description": description or "",
+            "due_date": dates.to_display(start_date),
+            "category": names.get(category_id, "None"),
+            "priority": PRIORITY_NAMES.get(priority, priority),
+            "status": "pending",
+            "repeat": UNIT_NAMES.get(unit, unit),
+            "every": every,
+            "completed": " ".join(dates.to_display(day) for day in sorted(completed.get(recurrence_id, []))),
+        }
+    # each repeating task is written once after the tasks, with the dates of its completed occurrences, so an
+    # export can be imported again without losing any series
+
+
+def export_tasks(user_id, path, database=db):
+    started = time.perf_counter()
+    written = write_rows(path, export_rows(user_id, database))
+    seconds = time.perf_counter() - started
+    return {
+        "exported": written,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(written / seconds) if seconds else 0,
+    }
+
+
+def find_user(username, database=db):
+    return database.fetchvalue("SELECT user_id FROM Users WHERE username = ?", (username,))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] not in ("import", "export"):
+        sys.exit("usage: python transfer.py import|export <username> <file.csv|file.jsonl>")
+    action, username, path = sys.argv[1:]
+    migrate(db)
+    user_id = find_user(username)
+    if user_id is None:
+        sys.exit(f"No user called {username}")
+    report = import_tasks(user_id, path) if action == "import" else export_tasks(user_id, path)
+    for error in report.pop("errors", []):
+        print(error)
+    print(json.dumps(report))
+    db.close()
+    # python transfer.py import|export <username> <file> moves a user's tasks in or out of task_manager.db
@@ -0,0 +1,78 @@
+from datetime import datetime
+
+from recurrences import UNITS, MAX_EVERY
+
+PRIORITIES = {"1": 1, "2": 2, "3": 3, "low": 1, "medium": 2, "high": 3}
+# the priorities that an imported file or an API request can give, as a number or a name
+PRIORITY_NAMES = {1: "Low", 2: "Medium", 3: "High"}
+
+
+def validate_task(inp_title, inp_date, inp_descr, inp_category, inp_priority):
+    if not inp_title.strip():
+        return False, "Title cannot be empty"
+
+    if len(inp_title) > 30:
+        return False, "Title must be less than 30 characters."
+
+    if len(inp_descr) > 200:
+        return False, "Description must be less than 200 characters."
+
+    try:
+        datetime.strptime(inp_date, "%d-%m-%Y")
+    except ValueError:
+        return False, "Due date must be in format DD-MM-YYYY."
+
+    if inp_category == "Select Category":
+        return False, "Please select a category."
+
+    if inp_priority is None:
+        return False, "Please select a priority."
+
+    return True, None
+    # the rules for a task, shared by CreateTask, EditTaskScreen and the bulk import in transfer.py
+
+
+def validate_repeat(inp_unit, inp_every):
+    if inp_unit not in UNITS.values():
+        return False, "Please select how often the task repeats."
+
+    if not inp_every.strip().isdigit() or not 1 <= int(inp_every) <= MAX_EVERY:
+        return False, f"Repeat every must be a number from 1 to {MAX_EVERY}."
+
+    return True, None
+    # inp_unit is "day", "week" or "month" and inp_every is the number typed in, so "2" and "week" is fortnightly
+
+
+def validate_category(category_name):
+    if not category_name.strip():
+        return False, "Category name cannot be empty"
+        # checks if name is present
+    elif len(category_name) > 20:
+        return False, "Category name must be less than 20 characters"
+        # checks if name is too long
+    else:
+        return True, None
+        # returns true if the category name is valid
+
+
+def validate_username(username):
+    if len(username) < 4:
+        return False, "Username must be 4+ characters."
+    return True, None
+    # whether the username is taken is found out by the insert itself, a SELECT first could be beaten by another
+    # signup between the check and the insert
+
+
+def validate_password(password):
+    special_characters = "!£$%^&*()@"  # Defines the set of special characters that must be present in the password
+
+    if len(password) < 8:
+        return False, "Password must be at least 8 characters long."
+    if not any(char.isupper() for char in password):
+        return False, "Password must contain at least one uppercase letter."
+    if not any(char.isdigit() for char in password):
+        return False, "Password must contain at least one digit."
+    if not any(char in special_characters for char in password):
+        return False, "Password must contain at least one special character."
+
+    return True, None